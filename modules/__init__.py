@@ -1,15 +1,51 @@
+import contextlib
 import pkgutil
 import sys
 import logging
+import hashlib
+import json
+import os
+import threading
+import time
+from enum import Enum
 from types import ModuleType
+from typing import Optional
 from importlib.util import module_from_spec
 
+from django.core.cache import cache
 from django.db import transaction
 
+from web import threadvars
+
 _all_modules = {}
 _initialized = False
 
 
+# Things that output of a module can depend on, besides its name, params, content and the article it is on.
+# Modules declare them with cache_depends_on(params) (or cache_depends_on(params, content) for modules with content);
+# output of modules that do not, or return None, is never cached
+class CacheDependency(Enum):
+    User = 'user'
+    PathParams = 'path_params'
+    Time = 'time'
+    ArticleTags = 'article_tags'
+    SiteGeneration = 'site_generation'
+    Votes = 'votes'
+
+
+_CACHE_TIMEOUT = 60 * 10
+# output that depends on time is cached for this long
+_CACHE_TIME_BUCKET = 60
+# hit rates of each worker process are logged this often, in seconds
+_CACHE_STATS_REPORT_DELAY = 60 * 10
+
+# module name -> [hits, misses, not cacheable], since the last report
+_cache_stats = {}
+_cache_stats_lock = threading.Lock()
+# process that runs the reporting thread; workers are forked, so each of them starts its own
+_cache_stats_reporter_pid = None
+
+
 class ModuleError(Exception):
     def __init__(self, message, *args):
         super().__init__(message, *args)
@@ -72,6 +108,108 @@ def module_allows_api(name_or_module):
     return m.__dict__['allow_api']()
 
 
+# Content is only known when the module is rendered; without it the result is what the module depends on for any content
+def module_cache_depends_on(name_or_module, params, content=None) -> Optional[set[CacheDependency]]:
+    m = get_module(name_or_module)
+    if m is None:
+        return None
+    if 'cache_depends_on' not in m.__dict__ or not callable(m.__dict__['cache_depends_on']):
+        return None
+    if module_has_content(m):
+        dependencies = m.__dict__['cache_depends_on'](params, content)
+    else:
+        dependencies = m.__dict__['cache_depends_on'](params)
+    return set(dependencies) if dependencies is not None else None
+
+
+def _count_cache_lookup(name, kind):
+    global _cache_stats_reporter_pid
+
+    with _cache_stats_lock:
+        _cache_stats.setdefault(name, [0, 0, 0])[kind] += 1
+        if _cache_stats_reporter_pid == os.getpid():
+            return
+        _cache_stats_reporter_pid = os.getpid()
+    t = threading.Thread(target=_report_cache_stats_periodically, daemon=True)
+    t.start()
+
+
+# Get lookup counts since the last report and start counting from zero
+def pop_cache_stats() -> dict[str, tuple[int, int, int]]:
+    with _cache_stats_lock:
+        stats = {k: tuple(v) for k, v in _cache_stats.items()}
+        _cache_stats.clear()
+    return stats
+
+
+def report_cache_stats():
+    for name, (hits, misses, not_cacheable) in sorted(pop_cache_stats().items()):
+        lookups = hits + misses
+        logging.info('Module cache (pid %d): %s: %.1f%% hits (%d hits, %d misses, %d not cacheable)', os.getpid(), name, hits * 100 / (lookups or 1), hits, misses, not_cacheable)
+
+
+def _report_cache_stats_periodically():
+    while True:
+        time.sleep(_CACHE_STATS_REPORT_DELAY)
+        try:
+            report_cache_stats()
+        except Exception as e:
+            logging.error('Failed to report module cache stats', exc_info=e)
+
+
+def _module_cache_key(name, dependencies, context, params, content):
+    from web.controllers.page_versions import get_site_generation, get_vote_generation
+    from web.models.sites import get_current_site
+
+    article = context.article
+    parts = [
+        name, params, content,
+        get_current_site().id,
+        article.id if article else None,
+        context.source_article.id if context.source_article else None
+    ]
+    for dependency in sorted(dependencies, key=lambda x: x.value):
+        match dependency:
+            case CacheDependency.User:
+                parts.append(context.user.pk)
+            case CacheDependency.PathParams:
+                parts.append(context.path_params)
+            case CacheDependency.Time:
+                parts.append(int(time.time() // _CACHE_TIME_BUCKET))
+            case CacheDependency.ArticleTags:
+                parts.append(article.tags_version if article else None)
+            case CacheDependency.SiteGeneration:
+                # one query per request instead of one per module
+                request_memo = threadvars.get('request_memo', {})
+                if 'site_generation' not in request_memo:
+                    request_memo['site_generation'] = get_site_generation()
+                parts.append(request_memo['site_generation'])
+            case CacheDependency.Votes:
+                request_memo = threadvars.get('request_memo', {})
+                if 'vote_generation' not in request_memo:
+                    request_memo['vote_generation'] = get_vote_generation()
+                parts.append(request_memo['vote_generation'])
+    return 'module:%s:%s' % (name, hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest())
+
+
+# Modules rendered inside another module (e.g. in ListPages templates) become part of its output.
+# It is only stored if everything rendered inside depends on nothing more than the outer module itself
+def _add_to_enclosing_modules(dependencies: Optional[set[CacheDependency]]):
+    for enclosing in threadvars.get('module_cache_enclosing', ()):
+        if dependencies is None or not dependencies <= enclosing['dependencies']:
+            enclosing['cacheable'] = False
+
+
+# Modules rendered inside the block must depend on nothing more than the given dependencies, e.g. those of a cached page.
+# The yielded scope has 'cacheable' set to False after the block if any of them does
+@contextlib.contextmanager
+def cache_dependency_scope(dependencies: set[CacheDependency]):
+    scope = {'dependencies': set(dependencies), 'cacheable': True}
+    with threadvars.context():
+        threadvars.put('module_cache_enclosing', threadvars.get('module_cache_enclosing', ()) + (scope,))
+        yield scope
+
+
 @transaction.atomic
 def render_module(name, context, params, content=None):
     if context and context.path_params.get('nomodule', 'false') == 'true':
@@ -79,6 +217,27 @@ def render_module(name, context, params, content=None):
     m = get_module(name)
     if m is None:
         raise ModuleError('Модуль \'%s\' не существует' % name)
+    name = name.lower()
+    dependencies = module_cache_depends_on(m, params, content) if context else None
+    _add_to_enclosing_modules(dependencies)
+    if dependencies is None:
+        _count_cache_lookup(name, 2)
+        return _render_module(name, m, context, params, content)
+
+    key = _module_cache_key(name, dependencies, context, params, content)
+    output = cache.get(key)
+    if output is not None:
+        _count_cache_lookup(name, 0)
+        return output
+    _count_cache_lookup(name, 1)
+    with cache_dependency_scope(dependencies) as this_module:
+        output = _render_module(name, m, context, params, content)
+    if this_module['cacheable']:
+        cache.set(key, output, _CACHE_TIMEOUT)
+    return output
+
+
+def _render_module(name, m, context, params, content):
     try:
         render = m.__dict__.get('render', None)
         if render is None:
@@ -1,5 +1,6 @@
 from renderer.templates import apply_template
-from .listpages import query_pages
+from . import CacheDependency
+from .listpages import query_pages, depends_on_votes
 
 import renderer
 import re
@@ -9,6 +10,18 @@ def has_content():
     return True
 
 
+def cache_depends_on(params, content=None):
+    # random order is different on every render
+    if params.get('order', '').strip().lower().startswith('random'):
+        return None
+    dependencies = {CacheDependency.PathParams, CacheDependency.ArticleTags, CacheDependency.SiteGeneration}
+    if params.get('created_by', '').strip() == '.':
+        dependencies.add(CacheDependency.User)
+    if depends_on_votes(params):
+        dependencies.add(CacheDependency.Votes)
+    return dependencies
+
+
 def render(context, params, content=None):
     # do url params
     for k, v in params.items():
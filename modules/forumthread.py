@@ -291,7 +291,7 @@ def allow_api():
 def api_for_article(context, _params):
     if not context.article:
         raise ModuleError('Страница не указана')
-    return {"threadId": str(articles.get_comment_info(context.article)[0])}
+    return {"threadId": str(articles.get_or_create_comment_thread(context.article).id)}
 
 
 def api_update(context, params):
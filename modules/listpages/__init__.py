@@ -18,6 +18,7 @@ from web import threadvars
 
 from .params import ListPagesParams
 from . import param
+from .. import CacheDependency
 
 from web.util.lazy_dict import LazyDict
 
@@ -30,6 +31,32 @@ def allow_api():
     return True
 
 
+# Ratings are used to filter and sort pages and can be shown in the template. Params taken from the url can be anything
+def depends_on_votes(params, content=None):
+    for key, value in params.items():
+        value = value.strip().lower()
+        if key.lower() in ('rating', 'votes', 'popularity') or value.startswith('@url|'):
+            return True
+    if params.get('order', '').strip().lower().startswith(('rating', 'votes', 'popularity')):
+        return True
+    return content is not None and ('%%rating' in content or '%%popularity' in content)
+
+
+def cache_depends_on(params, content=None):
+    # random order is different on every render
+    if params.get('order', '').strip().lower().startswith('random'):
+        return None
+    # comments are not tracked by the cache. commented_* variables are not supported yet, but their output will depend on them
+    if content is not None and '%%commented_' in content:
+        return None
+    dependencies = {CacheDependency.PathParams, CacheDependency.ArticleTags, CacheDependency.SiteGeneration}
+    if params.get('created_by', '').strip() == '.':
+        dependencies.add(CacheDependency.User)
+    if depends_on_votes(params, content):
+        dependencies.add(CacheDependency.Votes)
+    return dependencies
+
+
 def api_get(context, _params):
     return {"pages": [page.full_name for page in query_pages(context.article, _params, context.user, context.path_params, False)[0]]}
 
@@ -150,8 +177,7 @@ def query_pages(article, params, viewer=None, path_params=None, allow_pagination
     full_name_param = parsed_params.get_type(param.FullName)
     if full_name_param:
         if always_query:
-            category, name = articles.get_name(full_name_param)
-            q = Article.objects.filter(category__iexact=category, name__iexact=name)
+            q = Article.objects.filter(full_name_key=articles.get_link_target_name(full_name_param[0].full_name))
             return q, 0, 1, 1, int(q.count() > 0)
         article = articles.get_article(full_name_param[0].full_name)
         if article:
@@ -458,6 +484,7 @@ def render(context: RenderContext, params, content=None):
         pages, page_index, pagination_page, pagination_total_pages, total_pages = query_pages(context.article, params, context.user, context.path_params)
 
         pages = list(pages)
+        articles.prefetch_parents(pages)
         if get_boolean_param(params, 'reverse', False):
             pages = reversed(pages)
 
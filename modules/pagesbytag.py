@@ -3,11 +3,15 @@ import re
 from django.db.models import Count, Q
 
 from renderer.utils import render_template_from_string
-from . import ModuleError
+from . import ModuleError, CacheDependency
 from web.controllers.articles import get_tag
 from web.models.articles import Tag
 
 
+def cache_depends_on(params):
+    return {CacheDependency.PathParams, CacheDependency.SiteGeneration}
+
+
 def render(context, params):
     for k in context.path_params:
         params[k] = context.path_params[k]
@@ -4,7 +4,7 @@ import urllib.parse
 from django.db.models import Count, Q
 
 from renderer.utils import render_template_from_string
-from . import ModuleError
+from . import ModuleError, CacheDependency
 from web.models.articles import Tag, TagsCategory
 
 
@@ -80,6 +80,10 @@ def interpolate_color(min_color, max_color, value):
     return '#%02x%02x%02x' % (r, g, b)
 
 
+def cache_depends_on(params):
+    return {CacheDependency.SiteGeneration}
+
+
 def render(context, params):
     if 'minfontsize' in params and 'maxfontsize' in params:
         min_size = params['minfontsize']
@@ -4,11 +4,10 @@ from modules.listpages import param, query_pages, render_pagination
 from modules.listpages.params import ListPagesParams
 from renderer.utils import render_template_from_string
 
-from system.fields import CITextField
 from web.controllers import articles
-from web.models.articles import ExternalLink, Article
-from django.db.models import Q, Value as V, Case, When, Subquery, OuterRef
-from django.db.models.functions import Concat, Substr, StrIndex
+from web.models.articles import ArticleLink
+from django.db.models import Q, Value as V, Case, When
+from django.db.models.functions import Substr, StrIndex
 
 def has_content():
     return False
@@ -38,21 +37,15 @@ def render(context, params):
 
     filtered_pages, _, _, _, _ = query_pages(context.article, params, context.user, allow_pagination=False, always_query=True)
 
-    filtered_pages_names = filtered_pages.annotate(full_name=Concat('category', V(':'), 'name', output_field=models.TextField())).values('full_name')
-    
-    all_articles = Article.objects.values('name', 'category', 'title') \
-      .annotate(full_name=Concat('category', V(':'), 'name', output_field=models.TextField()))
-    q = ExternalLink.objects.filter(link_type='link') \
-      .annotate(link_from_complete=Case(When(~Q(link_from__contains=':'), then=Concat(V('_default:'), 'link_from', output_field=models.TextField())), default='link_from')) \
-      .filter(link_from_complete__in=Subquery(filtered_pages_names)) \
-      .annotate(link_to_complete=Case(When(~Q(link_to__contains=':'), then=Concat(V('_default:'), 'link_to', output_field=models.TextField())), default='link_to'))
-
-    q = q.exclude(link_to_complete__in=all_articles.values('full_name'))
+    q = ArticleLink.objects\
+        .filter(link_type=ArticleLink.Type.Link, to_article__isnull=True, from_article__in=filtered_pages.values('id'))\
+        .select_related('from_article')\
+        .order_by('id')
 
     for p in parsed_params.params:
         match p:
             case param.Category(allowed=allowed, not_allowed=not_allowed):
-                q = q.annotate(category_to=Case(When(~Q(link_to__contains=':'), then=V('_default')), default=Substr('link_to', 1, StrIndex('link_to', V(':')) - 1)))
+                q = q.annotate(category_to=Case(When(~Q(to_name__contains=':'), then=V('_default')), default=Substr('to_name', 1, StrIndex('to_name', V(':')) - 1)))
                 if allowed:
                     q = q.filter(category_to__in=allowed)
                 if not_allowed:
@@ -65,9 +58,7 @@ def render(context, params):
     total_links: int = q.count()
 
     offset: int = (page - 1) * per_page
-    links = q[offset : offset + per_page]
-
-    links = links.annotate(title=Subquery(all_articles.filter(full_name=OuterRef('link_from_complete')).values('title')))
+    links = [{'link_from': link.from_article.full_name, 'title': link.from_article.title, 'link_to': link.to_name} for link in q[offset : offset + per_page]]
 
     max_page: int = max(1, int(math.ceil(total_links / per_page)))
 
@@ -1,8 +1,6 @@
 import re
 from typing import Optional
 
-from django.db.models import TextField, Value
-from django.db.models.functions import Concat, Lower
 from django.utils.safestring import SafeString
 
 import modules
@@ -77,11 +75,11 @@ def callbacks_with_context(context):
                 # this must return Wiki markup because of the stage it runs at.
                 return '[[div class="error-block"]]Вставленная страница "%s" не существует ([[a href="/%s/edit/true" target="_blank"]]создать её сейчас[[/a]])[[/div]]' % (full_name, full_name)
 
-        # This function converts magical _default category to explicit _default category
-        # This is so that we can later reuse this in the database query that will just concat the category+name for articles
+        # This function converts page name to the indexed Article.full_name_key form
         @staticmethod
-        def _page_name_to_dumb(name):
-            return ('_default:%s' % name).lower() if ':' not in name else name.lower()
+        def _page_name_to_key(name):
+            from web.controllers.articles import get_link_target_name
+            return get_link_target_name(name)
 
         def fetch_includes(self, include_refs: list[ftml.IncludeRef]) -> list[ftml.FetchedPage]:
             if not self.context:
@@ -91,44 +89,41 @@ def callbacks_with_context(context):
 
             page_vars = get_page_vars(self.context.article)
 
-            refs_as_dumb = [self._page_name_to_dumb(x.full_name) for x in include_refs]
+            refs_as_keys = [self._page_name_to_key(x.full_name) for x in include_refs]
             included = ArticleVersion.objects\
                 .select_related('article')\
-                .annotate(full_name=Lower(Concat('article__category', Value(':'), 'article__name', output_field=TextField())))\
-                .filter(full_name__in=refs_as_dumb)\
+                .filter(article__full_name_key__in=refs_as_keys)\
                 .order_by('article__id', '-created_at')\
                 .distinct('article__id')
             included_map = {}
             for item in included:
-                included_map[item.full_name] = apply_template(item.source, lambda param: get_this_page_params(page_vars, param))
+                included_map[item.article.full_name_key] = apply_template(item.source, lambda param: get_this_page_params(page_vars, param))
             result = []
             new_includes = []
             is_include_overflow = threadvars.get('include_level', MAX_INCLUDE_LEVEL) <= 0
             for ref in include_refs:
-                ref_dumb = self._page_name_to_dumb(ref.full_name)
-                include_name = articles.normalize_article_name(ref_dumb)
+                ref_key = self._page_name_to_key(ref.full_name)
+                include_name = articles.normalize_article_name(ref_key)
                 if is_include_overflow:
                     threadvars.put('include_err', threadvars.get('include_err', []) + [include_name])
                     result.append(ftml.FetchedPage(full_name=ref.full_name, content=None))
                 else:
-                    result.append(ftml.FetchedPage(full_name=ref.full_name, content=included_map.get(ref_dumb, None)))
+                    result.append(ftml.FetchedPage(full_name=ref.full_name, content=included_map.get(ref_key, None)))
                     if include_name not in new_includes:
                         new_includes.append(include_name)
             return result
 
         def fetch_internal_links(self, page_refs: list[str]) -> list[ftml.PartialPageInfo]:
-            refs_as_dumb = [self._page_name_to_dumb(x) for x in page_refs]
-            pages = Article.objects\
-                .annotate(dumb_name=Lower(Concat('category', Value(':'), 'name', output_field=TextField())))\
-                .filter(dumb_name__in=refs_as_dumb)
+            refs_as_keys = [self._page_name_to_key(x) for x in page_refs]
+            pages = Article.objects.filter(full_name_key__in=refs_as_keys)
             page_map = {}
             for item in pages:
-                page_map[item.dumb_name] = item
+                page_map[item.full_name_key] = item
             result = []
             for ref in page_refs:
-                ref_dumb = self._page_name_to_dumb(ref)
-                if ref_dumb in page_map:
-                    result.append(ftml.PartialPageInfo(full_name=ref, exists=True, title=page_map[ref_dumb].title))
+                ref_key = self._page_name_to_key(ref)
+                if ref_key in page_map:
+                    result.append(ftml.PartialPageInfo(full_name=ref, exists=True, title=page_map[ref_key].title))
             return result
 
         def evaluate_expression(self, expr: str) -> any:
@@ -183,6 +183,10 @@ def parse_size(size):
 
 ARTICLE_SOURCE_LIMIT = int(os.environ.get('ARTICLE_SOURCE_LIMIT', '200000'))
 
+# 'delta' stores article versions as compressed keyframes with line-based deltas in between, 'plain' stores full sources
+ARTICLE_VERSION_STORAGE = os.environ.get('ARTICLE_VERSION_STORAGE', 'delta')
+ARTICLE_VERSION_KEYFRAME_INTERVAL = int(os.environ.get('ARTICLE_VERSION_KEYFRAME_INTERVAL', '25'))
+
 ABSOLUTE_MEDIA_UPLOAD_LIMIT = parse_size(os.environ.get('ABSOLUTE_MEDIA_UPLOAD_LIMIT', '0'))
 MEDIA_UPLOAD_LIMIT = parse_size(os.environ.get('MEDIA_UPLOAD_LIMIT', '0'))
 
@@ -14,9 +14,12 @@ import django
 django.setup()
 
 from django.core.wsgi import get_wsgi_application
-from shared_data import shared_articles, interwiki_batcher
+from shared_data import shared_articles, interwiki_batcher, page_cache
+from web.controllers import media
 
 shared_articles.init()
 interwiki_batcher.init()
+page_cache.init()
+media.init()
 
 application = get_wsgi_application()
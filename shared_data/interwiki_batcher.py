@@ -1,23 +1,41 @@
+import datetime
+import json
 import logging
-import multiprocessing
+import os
+import socket
+import socketserver
+import tempfile
 import threading
 import time
-import queue
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+
 import requests
-import json
+from django.db import close_old_connections
+
+from web.models.interwiki import InterwikiCacheEntry
 
 
 REQUESTS_PER_SECOND = 1
+# translations are served from cache for this long, then refreshed in background while the old value is still served
+CACHE_TTL = datetime.timedelta(hours=6)
+# failed queries are not retried for this long
+NEGATIVE_CACHE_TTL = datetime.timedelta(minutes=5)
+# the service keeps this many recently used entries in memory, and checks them against the database after
+# MEMORY_CACHE_TTL seconds, so that entries removed or changed in the admin panel are picked up
+MEMORY_CACHE_SIZE = 10000
+MEMORY_CACHE_TTL = 60
+INTERWIKI_API_URL = 'https://api.crom.avn.sh/graphql'
+# requests from workers are handled by this many threads, the rest wait in the socket backlog
+SERVER_THREADS = 32
 
 
-# These default values are used in dev server.
-# When running via multiprocessing, this should be replaced with Manager by calling init() before forking.
-manager = None
-state = None
-lock = None
+# Batching service runs in the process that called init(), workers talk to it over a Unix socket at socket_path.
+socket_path = None
+service = None
 
 
-def fetch_batch(urls):
+def fetch_batch(session, urls):
     urls = list(urls)
 
     queries = [{
@@ -55,8 +73,8 @@ def fetch_batch(urls):
             }
         })
 
-    base_result = requests.post(
-        'https://api.crom.avn.sh/graphql',
+    base_result = session.post(
+        INTERWIKI_API_URL,
         data=json.dumps(queries),
         headers={
             'Content-Type': 'application/json',
@@ -79,50 +97,175 @@ def fetch_batch(urls):
     return response_by_url
 
 
-def process_batches():
-    global client_requests
+def error_response(message):
+    return {
+        'data': None,
+        'errors': [{
+            'message': message
+        }]
+    }
 
-    while True:
-        with lock:
-            current_state = dict(state)
-            state.clear()
 
-        if current_state:
-            logging.info('InterWiki Batch: %s' % repr(list(current_state.keys())))
-            try:
-                response_by_url = fetch_batch(current_state.keys())
-                for url, response_queues in current_state.items():
-                    for response_queue in response_queues:
-                        response_queue.put(response_by_url[url])
-            except Exception as e:
-                logging.error('InterWiki: Failed to process batch:', exc_info=True)
-                for url, response_queues in current_state.items():
-                    for response_queue in response_queues:
-                        response_queue.put({
-                            'data': None,
-                            'errors': [{
-                                'message': str(e.args[0])
-                            }]
-                        })
+class InterwikiService:
+    def __init__(self):
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        # url -> Future resolved with the response of the next batch; identical urls share one Future
+        self.pending = {}
+        # url -> (response, fetched_at, time loaded), LRU mirror of InterwikiCacheEntry
+        self.cache = OrderedDict()
 
-        time.sleep(1 / REQUESTS_PER_SECOND)
+    def _remember(self, url, response, fetched_at):
+        with self.lock:
+            self.cache[url] = response, fetched_at, time.monotonic()
+            self.cache.move_to_end(url)
+            while len(self.cache) > MEMORY_CACHE_SIZE:
+                self.cache.popitem(last=False)
 
+    def _get_cached(self, url):
+        with self.lock:
+            cached = self.cache.get(url)
+            if cached is not None and time.monotonic() - cached[2] < MEMORY_CACHE_TTL:
+                self.cache.move_to_end(url)
+                return cached[0], cached[1]
+        close_old_connections()
+        entry = InterwikiCacheEntry.objects.filter(url=url).first()
+        if entry is None:
+            with self.lock:
+                self.cache.pop(url, None)
+            return None
+        response = error_response(entry.error) if entry.error else {'data': entry.data}
+        self._remember(url, response, entry.fetched_at)
+        return response, entry.fetched_at
 
-def query_interwiki(url, timeout=10):
-    global state, lock, manager
+    def _enqueue(self, url) -> Future:
+        with self.lock:
+            future = self.pending.get(url)
+            if future is None:
+                future = self.pending[url] = Future()
+            return future
+
+    def query(self, url, timeout):
+        cached = self._get_cached(url)
+        if cached is not None:
+            response, fetched_at = cached
+            age = datetime.datetime.now(datetime.timezone.utc) - fetched_at
+            if age > (NEGATIVE_CACHE_TTL if response.get('errors') else CACHE_TTL):
+                # stale-while-revalidate: old result is returned right away
+                self._enqueue(url)
+            return response
+        try:
+            return self._enqueue(url).result(timeout=timeout)
+        except TimeoutError:
+            return error_response('unable to fetch translations in %.2f seconds' % timeout)
+
+    # Store responses in the cache. Failed refreshes of entries that have data keep the data and are retried
+    # after NEGATIVE_CACHE_TTL. Returns the responses to give to the waiting queries
+    def store_results(self, response_by_url):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        close_old_connections()
+        failed_urls = [url for url, response in response_by_url.items() if response.get('errors')]
+        kept = dict(InterwikiCacheEntry.objects.filter(url__in=failed_urls, data__isnull=False).values_list('url', 'data'))
+        response_by_url = dict(response_by_url)
+        # entry becomes stale again after NEGATIVE_CACHE_TTL
+        retry_at = now - CACHE_TTL + NEGATIVE_CACHE_TTL
+        InterwikiCacheEntry.objects.filter(url__in=kept.keys()).update(fetched_at=retry_at)
+        for url, data in kept.items():
+            response_by_url[url] = {'data': data}
+            self._remember(url, response_by_url[url], retry_at)
+        for url, response in response_by_url.items():
+            if url in kept:
+                continue
+            errors = response.get('errors', [])
+            self._remember(url, response, now)
+            InterwikiCacheEntry.objects.update_or_create(url=url, defaults={
+                'data': None if errors else response['data'],
+                'error': errors[0]['message'] if errors else '',
+                'fetched_at': now
+            })
+        return response_by_url
+
+    # Send all queued urls in one request and resolve their futures
+    def process_batch(self):
+        with self.lock:
+            batch = self.pending
+            self.pending = {}
+
+        if not batch:
+            return
+
+        logging.info('InterWiki Batch: %s' % repr(list(batch.keys())))
+        try:
+            response_by_url = fetch_batch(self.session, batch.keys())
+        except Exception as e:
+            logging.error('InterWiki: Failed to process batch:', exc_info=True)
+            response_by_url = {url: error_response(str(e)) for url in batch.keys()}
+        try:
+            response_by_url = self.store_results(response_by_url)
+        except Exception:
+            logging.error('InterWiki: Failed to store batch in cache:', exc_info=True)
+        for url, future in batch.items():
+            future.set_result(response_by_url[url])
 
-    response_queue = manager.Queue(1)
+    def process_batches(self):
+        while True:
+            self.process_batch()
+            time.sleep(1 / REQUESTS_PER_SECOND)
 
-    with lock:
-        if url in state:
-            state[url].append(response_queue)
-        else:
-            state[url] = manager.list([response_queue])
+
+# One request per connection: a JSON line with url and timeout, answered with a JSON line with the response
+class InterwikiRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            response = service.query(request['url'], request['timeout'])
+        except Exception as e:
+            logging.error('InterWiki: Failed to process request:', exc_info=True)
+            response = error_response(str(e))
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+# Requests are handled by a fixed pool of threads, each of them keeps its database connection between requests
+class InterwikiServer(socketserver.UnixStreamServer):
+    request_queue_size = socket.SOMAXCONN
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=SERVER_THREADS, thread_name_prefix='interwiki')
+        # the accept loop stops while all threads are busy
+        self.slots = threading.BoundedSemaphore(SERVER_THREADS)
+
+    def process_request(self, request, client_address):
+        self.slots.acquire()
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+
+def query_interwiki(url, timeout=10):
+    if socket_path is None:
+        raise RuntimeError('InterWiki: batching service is not running')
 
     try:
-        result = response_queue.get(block=True, timeout=timeout)
-    except queue.Empty:
-        raise RuntimeError('InterWiki: unable to fetch translations in %.2f seconds' % timeout)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout + 1)
+            sock.connect(socket_path)
+            sock.sendall(json.dumps({'url': url, 'timeout': timeout}).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as f:
+                result = json.loads(f.readline())
+    except (OSError, ValueError) as e:
+        raise RuntimeError('InterWiki: unable to reach batching service: %s' % e)
 
     errors = result.get('errors', [])
     if errors:
@@ -132,11 +275,11 @@ def query_interwiki(url, timeout=10):
 
 
 def init():
-    global state, lock, manager
+    global socket_path, service
 
-    manager = multiprocessing.Manager()
-    lock = manager.RLock()
-    state = manager.dict()
+    service = InterwikiService()
+    socket_path = os.path.join(tempfile.mkdtemp(prefix='interwiki-'), 'batcher.sock')
+    server = InterwikiServer(socket_path, InterwikiRequestHandler)
 
-    t = threading.Thread(target=process_batches, daemon=True)
-    t.start()
+    threading.Thread(target=service.process_batches, daemon=True).start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
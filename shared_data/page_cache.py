@@ -0,0 +1,263 @@
+import contextlib
+import fcntl
+import gzip
+import hashlib
+import logging
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+from typing import Optional, Callable, Any
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from web.util.accept_encoding import choose_encoding
+
+
+# Full-page cache of article pages, shared by all worker processes.
+# There is one entry per (site, path) holding the latest rendered body and the page validator it was rendered for
+# (see web.controllers.page_versions). When the validator changes, the old body keeps being served
+# while one worker renders the new one. Concurrent renders of the same page version are coalesced with single_flight().
+MAX_ENTRY_AGE = 60 * 60 * 24
+MAX_CACHE_SIZE = 512 * 1024 * 1024
+SWEEP_DELAY = 60 * 10
+# per-page locks are striped over this many hex digits of the page key
+LOCK_STRIPE_DIGITS = 3
+# requests wait this long for a render done by another worker before rendering themselves
+FLIGHT_TIMEOUT = 30
+# render result is given to requests that come this long after it was finished
+FLIGHT_RESULT_TTL = 5
+FLIGHT_FILE_MAX_AGE = 60 * 10
+
+
+# Entry file layout: header (magic, etag length, plain, gzip and brotli body lengths), etag, bodies
+ENTRY_HEADER = struct.Struct('<4sIQQQ')
+ENTRY_MAGIC = b'SPC2'
+
+
+# This value is set by calling init() before forking. The cache is disabled until then.
+cache_dir = None
+
+
+class CacheEntry:
+    def __init__(self, etag: str, bodies: dict[str, bytes]):
+        self.etag = etag
+        # content encoding ('' for plain) -> body
+        self.bodies = bodies
+
+    def negotiate(self, accept_encoding: str) -> tuple[str, bytes]:
+        encoding = choose_encoding(accept_encoding, [x for x in ('br', 'gzip') if x in self.bodies])
+        return encoding, self.bodies[encoding]
+
+
+def is_enabled() -> bool:
+    return cache_dir is not None
+
+
+def make_key(site_slug: str, path: str) -> str:
+    return hashlib.sha256(('%s\0%s' % (site_slug, path)).encode('utf-8')).hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(cache_dir, '%s.page' % key)
+
+
+def get_entry(key: str) -> Optional[CacheEntry]:
+    try:
+        with open(_entry_path(key), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    magic, etag_length, plain_length, gzip_length, br_length = ENTRY_HEADER.unpack_from(data)
+    if magic != ENTRY_MAGIC:
+        return None
+    pos = ENTRY_HEADER.size
+    etag = data[pos:pos+etag_length].decode('utf-8')
+    pos += etag_length
+    bodies = {}
+    for encoding, length in (('', plain_length), ('gzip', gzip_length), ('br', br_length)):
+        if length:
+            bodies[encoding] = data[pos:pos+length]
+            pos += length
+    return CacheEntry(etag, bodies)
+
+
+def store_entry(key: str, etag: str, body: bytes):
+    etag = etag.encode('utf-8')
+    compressed_gzip = gzip.compress(body, 6)
+    compressed_br = brotli.compress(body, quality=6) if brotli is not None else b''
+    # new file is moved over the old one, so readers always see a complete entry
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(ENTRY_HEADER.pack(ENTRY_MAGIC, len(etag), len(body), len(compressed_gzip), len(compressed_br)))
+        f.write(etag)
+        f.write(body)
+        f.write(compressed_gzip)
+        f.write(compressed_br)
+    os.replace(tmp_path, _entry_path(key))
+
+
+# Try to become the worker that renders the page. Yields False if another thread or process is already doing it
+@contextlib.contextmanager
+def regeneration_lock(key: str):
+    lock_path = os.path.join(cache_dir, 'locks', '%s.lock' % key[:LOCK_STRIPE_DIGITS])
+    with open(lock_path, 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _lock_with_timeout(f, timeout) -> bool:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+
+
+def _read_flight_result(path):
+    try:
+        with open(path, 'rb') as f:
+            if time.time() - os.fstat(f.fileno()).st_mtime > FLIGHT_RESULT_TTL:
+                return None
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_flight_result(path, result):
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+    with os.fdopen(fd, 'wb') as out:
+        pickle.dump(result, out)
+    os.replace(tmp_path, path)
+
+
+def _is_current(f, path) -> bool:
+    try:
+        return os.fstat(f.fileno()).st_ino == os.stat(path).st_ino
+    except FileNotFoundError:
+        return False
+
+
+# Lock the flight of a key. Returns the locked file (None on timeout) and whether another caller held it first.
+# sweep() removes lock files of idle keys, so the lock is taken again if the file was removed while we waited for it
+def _lock_flight(base_path, timeout):
+    while True:
+        f = open(base_path + '.lock', 'a')
+        waited = False
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            with open(base_path + '.waiting', 'a'):
+                pass
+            waited = True
+            if not _lock_with_timeout(f, timeout):
+                f.close()
+                return None, waited
+        if _is_current(f, base_path + '.lock'):
+            return f, waited
+        f.close()
+
+
+# Run compute() once for all concurrent callers with the same key, in any worker process.
+# The first caller computes, others wait for it and get its result if can_share(result) is true, or compute themselves
+# in parallel. Callers that find the key busy leave a mark, and the result is only written for others if there is one
+def single_flight(key: str, compute: Callable[[], Any], can_share: Optional[Callable[[Any], bool]] = None, timeout: float = FLIGHT_TIMEOUT) -> Any:
+    if cache_dir is None:
+        return compute()
+    base_path = os.path.join(cache_dir, 'flights', key)
+    f, waited = _lock_flight(base_path, timeout)
+    if f is None:
+        logging.warning('Timed out waiting for render of %s', key)
+        return compute()
+    with f:
+        if waited:
+            result = _read_flight_result(base_path + '.result')
+            if result is not None:
+                return result
+        else:
+            try:
+                result = compute()
+                if os.path.exists(base_path + '.waiting'):
+                    if can_share is None or can_share(result):
+                        _write_flight_result(base_path + '.result', result)
+                    with contextlib.suppress(FileNotFoundError):
+                        os.unlink(base_path + '.waiting')
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    # the result of the first caller can't be shared, closing the file released the lock for other waiters
+    return compute()
+
+
+# Remove a lock file unless someone holds it. Callers that opened it before removal notice it in _lock_flight()
+def _unlink_lock(path):
+    with contextlib.suppress(FileNotFoundError), open(path, 'r') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        os.unlink(path)
+
+
+def sweep():
+    for entry in os.scandir(os.path.join(cache_dir, 'flights')):
+        if time.time() - entry.stat().st_mtime > FLIGHT_FILE_MAX_AGE:
+            if entry.name.endswith('.lock'):
+                _unlink_lock(entry.path)
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(entry.path)
+
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and entry.name.endswith('.page'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+    total_size = sum(size for _, size, _ in entries)
+    removed = 0
+    for mtime, size, path in entries:
+        if time.time() - mtime < MAX_ENTRY_AGE and total_size <= MAX_CACHE_SIZE:
+            break
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+        total_size -= size
+        removed += 1
+    if removed:
+        logging.info('Removed %d page cache entries', removed)
+
+
+def background_sweep():
+    while True:
+        time.sleep(SWEEP_DELAY)
+        try:
+            sweep()
+        except Exception as e:
+            logging.error('Failed to sweep page cache', exc_info=e)
+
+
+def init():
+    global cache_dir
+
+    cache_dir = tempfile.mkdtemp(prefix='page-cache-')
+    os.mkdir(os.path.join(cache_dir, 'locks'))
+    os.mkdir(os.path.join(cache_dir, 'flights'))
+
+    t = threading.Thread(target=background_sweep, daemon=True)
+    t.start()
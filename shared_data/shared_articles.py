@@ -1,81 +1,223 @@
+import gzip
+import json
 import logging
+import mmap
 import multiprocessing
+import os
+import queue
+import struct
+import tempfile
 import threading
 import time
+from typing import Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
 
 from renderer.utils import render_user_to_json
 from web import threadvars
 from web.controllers import articles
+from web.events import on_trigger
 from web.models.articles import ArticleLogEntry, Article
 from web.models.sites import Site, get_current_site
 
 
-BACKGROUND_RELOAD_DELAY = 60 * 15
+# Full rebuild is only a safety net for changes made outside of web workers (management commands, admin).
+# Everything else arrives through the change feed.
+BACKGROUND_RELOAD_DELAY = 60 * 60 * 6
+CHANGES_POLL_DELAY = 5
+BOOTSTRAP_CHUNK_SIZE = 500
+
+
+# Snapshot file layout: header (magic, generation, JSON length, gzipped JSON length), JSON, gzipped JSON
+SNAPSHOT_HEADER = struct.Struct('<4sQQQ')
+SNAPSHOT_MAGIC = b'SAS1'
+
+
+# These values are set by calling init() before forking.
+# Snapshots are published as files in snapshot_dir, which all worker processes map into memory.
+snapshot_dir = None
+# (site slug, article id) of articles that have to be recomputed
+changes = None
+
+# per-process mapped snapshots: site slug -> Snapshot
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+class Snapshot:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.file_id = (stat.st_ino, stat.st_mtime_ns)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.generation, json_length, gzip_length = SNAPSHOT_HEADER.unpack_from(self._mm)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError('Invalid article snapshot file %s' % path)
+        self._json_range = (SNAPSHOT_HEADER.size, SNAPSHOT_HEADER.size + json_length)
+        self._gzip_range = (self._json_range[1], self._json_range[1] + gzip_length)
+
+    # Views of the mapped file, so that the data is not copied for every request
+
+    @property
+    def json(self) -> memoryview:
+        return memoryview(self._mm)[self._json_range[0]:self._json_range[1]]
+
+    @property
+    def gzip(self) -> memoryview:
+        return memoryview(self._mm)[self._gzip_range[0]:self._gzip_range[1]]
+
 
+def _snapshot_path(site_slug):
+    return os.path.join(snapshot_dir, '%s.json.snapshot' % site_slug.replace('/', '_'))
 
-# These default values are used in dev server.
-# When running via multiprocessing, this should be replaced with Manager by calling init() before forking.
-state = None
-lock = None
+
+def publish_snapshot(site_slug, entries):
+    data = json.dumps(entries, cls=DjangoJSONEncoder).encode('utf-8')
+    compressed = gzip.compress(data, 6)
+    path = _snapshot_path(site_slug)
+    # new file is moved over the old one, so readers that mapped the old file keep a consistent copy
+    fd, tmp_path = tempfile.mkstemp(dir=snapshot_dir)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, time.time_ns(), len(data), len(compressed)))
+        f.write(data)
+        f.write(compressed)
+    os.replace(tmp_path, path)
+
+
+def get_snapshot(site_slug) -> Optional[Snapshot]:
+    if snapshot_dir is None:
+        return None
+    path = _snapshot_path(site_slug)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    with _snapshots_lock:
+        snapshot = _snapshots.get(site_slug)
+        if snapshot is None or snapshot.file_id != (stat.st_ino, stat.st_mtime_ns):
+            snapshot = Snapshot(path)
+            _snapshots[site_slug] = snapshot
+        return snapshot
+
+
+def build_article_entries(site, article_ids) -> dict[int, dict]:
+    db_articles = list(Article.objects.filter(id__in=article_ids).select_related('author__visual_group'))
+    last_events = ArticleLogEntry.objects\
+        .filter(article_id__in=article_ids)\
+        .select_related('user__visual_group')\
+        .order_by('article_id', '-rev_number')\
+        .distinct('article_id')
+    last_event_users = {x.article_id: x.user for x in last_events}
+    ratings = articles.get_ratings(db_articles)
+    tags = articles.get_tags_of_articles(article_ids)
+    entries = {}
+    for article in db_articles:
+        rating, rating_votes, popularity, rating_mode = ratings[article.id]
+        entries[article.id] = {
+            'uid': article.id,
+            'pageId': article.full_name,
+            'title': article.title,
+            'canonicalUrl': '//%s/%s' % (site.domain, article.full_name),
+            'createdAt': article.created_at.isoformat(),
+            'updatedAt': article.updated_at.isoformat(),
+            'createdBy': render_user_to_json(article.author),
+            'updatedBy': render_user_to_json(last_event_users.get(article.id)),
+            'rating': {
+                'value': rating,
+                'votes': rating_votes,
+                'popularity': popularity,
+                'mode': str(rating_mode)
+            },
+            'tags': tags[article.id]
+        }
+    return entries
+
+
+def reload_site(site) -> dict[int, dict]:
+    logging.info('%s: Reloading articles for %s', threading.current_thread().ident, site.slug)
+    article_ids = list(Article.objects.order_by('id').values_list('id', flat=True))
+    entries = {}
+    for i in range(0, len(article_ids), BOOTSTRAP_CHUNK_SIZE):
+        entries.update(build_article_entries(site, article_ids[i:i+BOOTSTRAP_CHUNK_SIZE]))
+    logging.info('%s: Finished reloading articles for %s', threading.current_thread().ident, site.slug)
+    return entries
+
+
+def drain_changes() -> dict[str, set[int]]:
+    changed = {}
+    while True:
+        try:
+            site_slug, article_id = changes.get_nowait()
+        except queue.Empty:
+            return changed
+        changed.setdefault(site_slug, set()).add(article_id)
 
 
 def background_reload():
-    global state
+    # site slug -> {article id -> entry}, published as a snapshot after every change
+    entries = {}
+    last_reload = 0
 
     while True:
         try:
-            sites = Site.objects.all()
-            for site in sites:
-                with threadvars.context():
-                    threadvars.put('current_site', site)
-                    logging.info('%s: Reloading articles for %s', threading.current_thread().ident, site.slug)
-                    db_articles = Article.objects.prefetch_related("votes", "tags")
-                    stored_articles = []
-                    for article in db_articles:
-                        last_event = ArticleLogEntry.objects.filter(article=article).order_by('-rev_number')[0]
-                        rating, rating_votes, popularity, rating_mode = articles.get_rating(article)
-                        stored_articles.append({
-                            'uid': article.id,
-                            'pageId': article.full_name,
-                            'title': article.title,
-                            'canonicalUrl': '//%s/%s' % (site.domain, article.full_name),
-                            'createdAt': article.created_at.isoformat(),
-                            'updatedAt': article.updated_at.isoformat(),
-                            'createdBy': render_user_to_json(article.author),
-                            'updatedBy': render_user_to_json(last_event.user),
-                            'rating': {
-                                'value': rating,
-                                'votes': rating_votes,
-                                'popularity': popularity,
-                                'mode': str(rating_mode)
-                            },
-                            'tags': articles.get_tags(article)
-                        })
-                    logging.info('%s: Finished reloading articles for %s', threading.current_thread().ident, site.slug)
-                state[site.slug] = stored_articles
-            with lock:
-                nonexistent_sites = [k for k in state.keys() if k not in [site.slug for site in sites]]
-                for site in nonexistent_sites:
-                    del state[site]
-            time.sleep(BACKGROUND_RELOAD_DELAY)
+            sites = {site.slug: site for site in Site.objects.all()}
+            if time.time() - last_reload > BACKGROUND_RELOAD_DELAY:
+                # changes that arrive during reload are applied on top of it
+                drain_changes()
+                for site in sites.values():
+                    with threadvars.context():
+                        threadvars.put('current_site', site)
+                        entries[site.slug] = reload_site(site)
+                    publish_snapshot(site.slug, list(entries[site.slug].values()))
+                last_reload = time.time()
+            else:
+                for site_slug, article_ids in drain_changes().items():
+                    site = sites.get(site_slug)
+                    if site is None or site_slug not in entries:
+                        continue
+                    with threadvars.context():
+                        threadvars.put('current_site', site)
+                        updated = build_article_entries(site, list(article_ids))
+                    site_entries = entries[site_slug]
+                    for article_id in article_ids:
+                        if article_id in updated:
+                            site_entries[article_id] = updated[article_id]
+                        else:
+                            site_entries.pop(article_id, None)
+                    publish_snapshot(site_slug, list(site_entries.values()))
+                    logging.info('%s: Updated %d articles for %s', threading.current_thread().ident, len(article_ids), site_slug)
+            nonexistent_sites = [k for k in entries.keys() if k not in sites]
+            for site_slug in nonexistent_sites:
+                os.unlink(_snapshot_path(site_slug))
+                del entries[site_slug]
+            time.sleep(CHANGES_POLL_DELAY)
         except Exception as e:
             logging.error('Failed to background-reload pages', exc_info=e)
-            time.sleep(BACKGROUND_RELOAD_DELAY / 2)
+            time.sleep(CHANGES_POLL_DELAY * 2)
+
 
+@on_trigger(articles.OnCreateArticle)
+@on_trigger(articles.OnEditArticle)
+@on_trigger(articles.OnDeleteArticle)
+@on_trigger(articles.OnVote)
+def on_article_changed(event):
+    if changes is None:
+        return
+    site = get_current_site(required=False)
+    if site is not None:
+        changes.put((site.slug, event.article_id))
 
-def get_all_articles():
-    global state
 
-    site = get_current_site()
-    return state.get(site.slug, [])
+def get_current_snapshot() -> Optional[Snapshot]:
+    return get_snapshot(get_current_site().slug)
 
 
 def init():
-    global state, lock
+    global snapshot_dir, changes
 
+    snapshot_dir = tempfile.mkdtemp(prefix='shared-articles-')
     manager = multiprocessing.Manager()
-    state = manager.dict()
-    lock = manager.RLock()
+    changes = manager.Queue()
 
     t = threading.Thread(target=background_reload, daemon=True)
     t.start()
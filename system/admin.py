@@ -1,6 +1,6 @@
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.forms import UserChangeForm
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.urls import path
 from django import forms
 from guardian.admin import GuardedModelAdmin
@@ -25,12 +25,13 @@ class AdvancedUserAdmin(UserAdmin):
     list_filter = ['is_superuser', 'is_staff', 'is_active', 'visual_group']
     list_display = ['username_or_wd', 'email']
     search_fields = ['username', 'wikidot_username', 'email']
-    readonly_fields = ["api_key"]
+    readonly_fields = ["api_key_hash"]
+    actions = ["regenerate_api_key"]
 
     fieldsets = UserAdmin.fieldsets
     fieldsets[2][1]['fields'] = ('is_active', 'inactive_until', 'is_forum_active', 'forum_inactive_until', 'is_editor', 'is_staff', 'is_superuser', 'visual_group', 'groups', 'user_permissions')
     fieldsets[1][1]["fields"] += ("bio", "avatar")
-    fieldsets[0][1]["fields"] = ("username", "wikidot_username", "type", "password", "api_key")
+    fieldsets[0][1]["fields"] = ("username", "wikidot_username", "type", "password", "api_key_hash")
 
     inlines = []
 
@@ -41,6 +42,13 @@ class AdvancedUserAdmin(UserAdmin):
         urls.insert(0, path("<id>/activate/", InviteView.as_view()))
         return urls
 
+    # plain keys are not stored, so the new key is shown only once
+    @admin.action(description="Сгенерировать новый апи-ключ")
+    def regenerate_api_key(self, request, queryset):
+        for user in queryset.filter(type=User.UserType.Bot):
+            user._generate_apikey()
+            messages.success(request, "Апи-ключ бота %s: %s" % (user.username, user.api_key))
+
     def username_or_wd(self, obj):
         if obj.type == User.UserType.Wikidot:
             return 'wd:%s' % obj.wikidot_username
@@ -1,7 +1,4 @@
-from django.contrib.auth import get_user_model
-
-
-User = get_user_model()
+from system.models import get_bot_by_api_key
 
 
 class BotAuthTokenMiddleware(object):
@@ -10,8 +7,7 @@ class BotAuthTokenMiddleware(object):
 
     def __call__(self, request):
         if "Authorization" in request.headers and request.headers["Authorization"].startswith("Bearer "):
-            try:
-                request.user = User.objects.get(type="bot", api_key=request.headers["Authorization"][7:])
-            except User.DoesNotExist:
-                pass
+            user = get_bot_by_api_key(request.headers["Authorization"][7:])
+            if user is not None:
+                request.user = user
         return self.get_response(request)
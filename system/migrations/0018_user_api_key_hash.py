@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0017_alter_user_visual_group'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='api_key_hash',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='Хеш апи-ключа'),
+        ),
+    ]
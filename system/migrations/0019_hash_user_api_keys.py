@@ -0,0 +1,27 @@
+import hashlib
+
+from django.db import migrations
+
+
+def hash_api_keys(apps, schema_editor):
+    User = apps.get_model("system", "User")
+    batch = []
+    for user in User.objects.filter(api_key__isnull=False).only('id', 'api_key'):
+        user.api_key_hash = hashlib.sha256(user.api_key.encode('utf-8')).hexdigest()
+        batch.append(user)
+    User.objects.bulk_update(batch, ['api_key_hash'])
+
+
+def reverse_func(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0018_user_api_key_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(hash_api_keys, reverse_func, atomic=True)
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-19 09:41
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('system', '0019_hash_user_api_keys'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='api_key',
+        ),
+    ]
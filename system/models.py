@@ -7,6 +7,9 @@ from django.db import models
 from datetime import datetime
 from zoneinfo import ZoneInfo
 import re
+import hashlib
+import threading
+import time
 from django.db.models.functions import Collate
 
 class StrictUsernameValidator(RegexValidator):
@@ -30,6 +33,10 @@ class VisualUserGroup(auto_prefetch.Model):
         return self.name
 
 
+def hash_api_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+
 class User(AbstractUser):
     class Meta:
         verbose_name = "Пользователь"
@@ -56,7 +63,7 @@ class User(AbstractUser):
     avatar = models.ImageField(null=True, blank=True, upload_to='-/users', verbose_name="Аватар")
     bio = models.TextField(blank=True, verbose_name="Описание")
 
-    api_key = models.CharField(unique=True, blank=True, null=True, max_length=67, verbose_name="Апи-ключ")
+    api_key_hash = models.CharField(unique=True, blank=True, null=True, max_length=64, verbose_name="Хеш апи-ключа")
 
     is_forum_active = models.BooleanField(verbose_name='Активирован форум', default=True)
     forum_inactive_until = models.DateTimeField(verbose_name='Деактивировать форум до', null=True)
@@ -89,9 +96,11 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    # only the hash is stored, plain key is available in self.api_key right after generation
     def _generate_apikey(self, commit=True):
         self.password = ""
         self.api_key = make_password(self.username)[21:]
+        self.api_key_hash = hash_api_key(self.api_key)
         if commit:
             self.save()
 
@@ -99,11 +108,56 @@ class User(AbstractUser):
         if not self.wikidot_username:
             self.wikidot_username = None
         if self.type == "bot":
-            if not self.api_key:
+            if not self.api_key_hash:
                 self._generate_apikey(commit=False)
         else:
-            self.api_key = None
-        return super().save(*args, **kwargs)
+            self.api_key_hash = None
+        result = super().save(*args, **kwargs)
+        invalidate_bot_cache(self.id)
+        # users are shown on pages, so their changes make new versions of pages
+        from web.controllers.page_versions import on_user_changed
+        on_user_changed(kwargs.get('update_fields'))
+        return result
+
+    def delete(self, *args, **kwargs):
+        from web.controllers.page_versions import on_user_changed
+        user_id = self.id
+        result = super().delete(*args, **kwargs)
+        invalidate_bot_cache(user_id)
+        on_user_changed(None)
+        return result
+
+
+# Bots authenticated by api key hash: hash -> (database row of the user, expiration time).
+# Every request gets its own User built from the row, so that changes made while handling one request are not seen by others.
+# Saving a user drops its entry in the current process, other processes pick up changes after _BOT_CACHE_TTL seconds
+_BOT_CACHE_TTL = 60
+_bot_cache = {}
+_bot_cache_lock = threading.Lock()
+
+
+def get_bot_by_api_key(api_key: str):
+    key_hash = hash_api_key(api_key)
+    now = time.monotonic()
+    field_names = [f.attname for f in User._meta.concrete_fields]
+    with _bot_cache_lock:
+        cached = _bot_cache.get(key_hash)
+    if cached is not None and cached[1] > now:
+        return User.from_db(User.objects.db, field_names, cached[0])
+    row = User.objects.filter(type=User.UserType.Bot, api_key_hash=key_hash).values_list(*field_names).first()
+    with _bot_cache_lock:
+        if row is not None:
+            _bot_cache[key_hash] = (row, now + _BOT_CACHE_TTL)
+        else:
+            _bot_cache.pop(key_hash, None)
+    return User.from_db(User.objects.db, field_names, row) if row is not None else None
+
+
+def invalidate_bot_cache(user_id):
+    id_index = User._meta.concrete_fields.index(User._meta.pk)
+    with _bot_cache_lock:
+        for key_hash in [k for k, (row, _) in _bot_cache.items() if row[id_index] == user_id]:
+            del _bot_cache[key_hash]
 
 
 class UsedToken(auto_prefetch.Model):
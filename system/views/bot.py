@@ -35,7 +35,7 @@ class CreateBotView(FormView):
         if not User.objects.filter(username=username).exists():
             bot = User(username=username, type="bot")
             bot.save()
-            messages.success(self.request, "Бот успешно создан")
+            messages.success(self.request, "Бот успешно создан. Апи-ключ (показывается один раз): %s" % bot.api_key)
         else:
             messages.error(self.request, "Имя пользователя занято")
         return redirect(self.get_success_url())
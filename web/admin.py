@@ -6,6 +6,7 @@ from django import forms
 from .models.articles import *
 from .models.forum import *
 from .models.sites import Site
+from .models.interwiki import InterwikiCacheEntry
 
 class TagsCategoryForm(forms.ModelForm):
     class Meta:
@@ -123,4 +124,10 @@ class ForumCategoryAdmin(admin.ModelAdmin):
     form = ForumCategoryForm
     search_fields = ['name', 'slug', 'description']
     list_filter = ['section']
-    list_display = ['name', 'section']
\ No newline at end of file
+    list_display = ['name', 'section']
+
+
+@admin.register(InterwikiCacheEntry)
+class InterwikiCacheEntryAdmin(admin.ModelAdmin):
+    search_fields = ['url']
+    list_display = ['url', 'fetched_at', 'error']
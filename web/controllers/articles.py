@@ -1,10 +1,9 @@
-import shutil
-from pathlib import Path
 
 from django.contrib.auth.models import AbstractUser as _UserType
+from django.core.cache import cache
 from django.db import transaction
-from django.db.models import QuerySet, Sum, Avg, Count, Max, TextField, Value, IntegerField, Q, F
-from django.db.models.functions import Coalesce, Concat, Lower
+from django.db.models import QuerySet, Sum, Avg, Count, Max, IntegerField, Q, F
+from django.db.models.functions import Coalesce
 
 import renderer
 from renderer import RenderContext
@@ -16,18 +15,45 @@ from web.models.files import *
 from typing import Optional, Union, Sequence, Tuple, Dict
 import datetime
 import re
-import os.path
 
 import unicodedata
 
 from web.models.forum import ForumThread, ForumPost
-from web.util import lock_table
+from web.util import atomic_with_retry
+from web.controllers import media
+from web.events import EventBase
 
 _FullNameOrArticle = Optional[Union[str, Article]]
 _FullNameOrCategory = Optional[Union[str, Category]]
 _FullNameOrTag = Optional[Union[str, Tag]]
 
 
+class OnCreateArticle(EventBase):
+    article_id: int
+
+
+# Emitted for every change that is recorded in article log (source, title, name, tags, files, ...), and for tag changes made without log
+class OnEditArticle(EventBase):
+    article_id: int
+
+
+class OnDeleteArticle(EventBase):
+    article_id: int
+
+
+class OnVote(EventBase):
+    article_id: int
+
+
+# Events are only emitted after commit, so that handlers never see data that may be rolled back
+def _emit_on_commit(event: EventBase):
+    transaction.on_commit(event.emit)
+
+
+# tag categories can be renamed or reordered without touching articles, so cached footers expire after a while
+_TAGS_CATEGORIES_CACHE_TIMEOUT = 300
+
+
 # Returns (category, name) from a full name
 def get_name(full_name: str) -> Tuple[str, str]:
     split = full_name.split(':', 1)
@@ -62,18 +88,18 @@ def get_article(full_name_or_article: _FullNameOrArticle) -> Optional[Article]:
     if full_name_or_article is None:
         return None
     if type(full_name_or_article) == str:
-        full_name_or_article = full_name_or_article.lower()
-        category, name = get_name(full_name_or_article)
-        objects = Article.objects.filter(category__iexact=category, name__iexact=name)
-        if objects:
-            return objects[0]
-        else:
-            return None
+        return Article.objects.filter(full_name_key=get_link_target_name(full_name_or_article)).first()
     if not isinstance(full_name_or_article, Article):
         raise ValueError('Expected str or Article')
     return full_name_or_article
 
 
+# Converts page reference to the form it is stored in Article.full_name_key and ArticleLink.to_name
+def get_link_target_name(full_name: str) -> str:
+    category, name = get_name(full_name)
+    return Article.make_full_name_key(category, name)
+
+
 def get_full_name(full_name_or_article: _FullNameOrArticle) -> str:
     if full_name_or_article is None:
         return ''
@@ -83,16 +109,22 @@ def get_full_name(full_name_or_article: _FullNameOrArticle) -> str:
 
 
 def deduplicate_name(full_name: str, allowed_article: Optional[Article] = None) -> str:
+    # name, name-2, name-3, ... are fetched at once. The prefix also matches names like name-other, those are skipped
+    key = get_link_target_name(full_name)
+    candidates = Article.objects.filter(Q(full_name_key=key) | Q(full_name_key__startswith=key + '-')).values_list('full_name_key', 'id')
+    numbered = re.compile(r'^%s(-\d+)?$' % re.escape(key))
+    taken = {name_key: article_id for name_key, article_id in candidates if numbered.match(name_key)}
     i = 0
     while True:
         i += 1
         name_to_try = '%s-%d' % (full_name, i) if i > 1 else full_name
-        article2 = get_article(name_to_try)
-        if not article2 or (allowed_article and article2.id == allowed_article.id):
+        article2_id = taken.get(get_link_target_name(name_to_try))
+        if not article2_id or (allowed_article and article2_id == allowed_article.id):
             return name_to_try
 
 
 # Creates article with specified id. Does not add versions
+@atomic_with_retry
 def create_article(full_name: str, user: Optional[_UserType] = None) -> Article:
     category, name = get_name(full_name)
     article = Article(
@@ -103,27 +135,31 @@ def create_article(full_name: str, user: Optional[_UserType] = None) -> Article:
         author=user
     )
     article.save()
+    # links that were waiting for this page
+    ArticleLink.objects.filter(to_name=get_link_target_name(full_name), to_article__isnull=True).update(to_article=article)
+    _emit_on_commit(OnCreateArticle(article_id=article.id))
     return article
 
 
 # Adds log entry to article
+@atomic_with_retry
 def add_log_entry(full_name_or_article: _FullNameOrArticle, log_entry: ArticleLogEntry):
     article = get_article(full_name_or_article)
-    with transaction.atomic():
-        with lock_table(ArticleLogEntry):
-            # this black magic forces lock of ArticleLogEntry table on this article id,
-            # so that two concurrent log entries wait for each other and are not violating unique constraint on rev_number.
-            current_log = ArticleLogEntry.objects.select_related('article')\
-                                                 .select_for_update()\
-                                                 .filter(article=article)
-            max_rev_number = current_log.aggregate(max=Max('rev_number')).get('max')
-            if max_rev_number is None:
-                max_rev_number = -1
-            log_entry.rev_number = max_rev_number + 1
-            log_entry.save()
-
-            article.updated_at = log_entry.created_at
-            article.save()
+    # locking the article row serializes log entries of this article only,
+    # so that two concurrent log entries wait for each other and are not violating unique constraint on rev_number.
+    Article.objects.select_for_update().filter(id=article.id).values_list('id', flat=True).get()
+    max_rev_number = ArticleLogEntry.objects.filter(article=article).aggregate(max=Max('rev_number')).get('max')
+    if max_rev_number is None:
+        max_rev_number = -1
+    # entry might be left with the id of a rolled back insert when the transaction is retried
+    log_entry.pk = None
+    log_entry.rev_number = max_rev_number + 1
+    log_entry.save()
+
+    # not using article.save() to not overwrite columns changed concurrently by other edits
+    article.updated_at = log_entry.created_at
+    Article.objects.filter(id=article.id).update(updated_at=log_entry.created_at)
+    _emit_on_commit(OnEditArticle(article_id=article.id))
 
 
 # Gets all log entries of article, sorted
@@ -138,26 +174,30 @@ def get_latest_log_entry(full_name_or_article: _FullNameOrArticle) -> Optional[A
 
 
 # Gets list of log entries from article, sorted, with specified bounds
-def get_log_entries_paged(full_name_or_article: _FullNameOrArticle, c_from: int, c_to: int, get_all: bool = False) -> Tuple[QuerySet[ArticleLogEntry], int]:
-    log_entries = get_log_entries(full_name_or_article)
-    total_count = len(log_entries)
-    if not get_all:
+def get_log_entries_paged(full_name_or_article: _FullNameOrArticle, c_from: int, c_to: int, get_all: bool = False, before: Optional[int] = None) -> Tuple[QuerySet[ArticleLogEntry], int]:
+    log_entries = get_log_entries(full_name_or_article).select_related('user__visual_group')
+    total_count = log_entries.count()
+    if before is not None:
+        # keyset pagination: next (c_to - c_from) entries older than revision 'before'
+        log_entries = log_entries.filter(rev_number__lt=before)[:max(c_to - c_from, 0)]
+    elif not get_all:
         log_entries = log_entries[c_from:c_to]
     return log_entries, total_count
 
 
 # Revert all revisions to specific revision
+@atomic_with_retry
 def revert_article_version(full_name_or_article: _FullNameOrArticle, rev_number: int, user: Optional[_UserType] = None):
     article = get_article(full_name_or_article)
 
     new_props = {}
 
-    for entry in get_log_entries(article):
-        if entry.rev_number <= rev_number:
-            break
+    # source of the oldest reverted change wins, so the version is only looked up once after the loop
+    source_version_id = None
 
+    for entry in get_log_entries(article).filter(rev_number__gt=rev_number):
         if entry.type == ArticleLogEntry.LogEntryType.Source:
-            new_props['source'] = get_previous_version(entry.meta['version_id']).source
+            source_version_id = entry.meta['version_id']
         elif entry.type == ArticleLogEntry.LogEntryType.Title:
             new_props['title'] = entry.meta['prev_title']
         elif entry.type == ArticleLogEntry.LogEntryType.Name:
@@ -212,7 +252,7 @@ def revert_article_version(full_name_or_article: _FullNameOrArticle, rev_number:
             new_props['votes'] = entry.meta
         elif entry.type == ArticleLogEntry.LogEntryType.Revert:
             if 'source' in entry.meta:
-                new_props['source'] = get_previous_version(entry.meta['source']['version_id']).source
+                source_version_id = entry.meta['source']['version_id']
             if 'title' in entry.meta:
                 new_props['title'] = entry.meta['title']['prev_title']
             if 'name' in entry.meta:
@@ -256,6 +296,9 @@ def revert_article_version(full_name_or_article: _FullNameOrArticle, rev_number:
             if 'votes' in entry.meta:
                 new_props['votes'] = entry.meta['votes']
 
+    if source_version_id is not None:
+        new_props['source'] = get_previous_version(source_version_id).source
+
     subtypes = []
 
     meta = {}
@@ -264,40 +307,42 @@ def revert_article_version(full_name_or_article: _FullNameOrArticle, rev_number:
     files_deleted_meta = []
     files_renamed_meta = []
 
+    files = File.objects.in_bulk(
+        list(new_props.get('files_renamed', {}).keys()) +
+        list(new_props.get('files_deleted', {}).keys()) +
+        list(new_props.get('files_restored', {}).keys())
+    )
+    changed_files = {}
+
     for f_id, new_name in new_props.get('files_renamed', {}).items():
-        try:
-            file = File.objects.get(id=f_id)
-            files_renamed_meta.append({'id': f_id, 'name': new_name, 'prev_name': file.name})
-            file.name = new_name
-            file.save()
-        except File.DoesNotExist:
+        file = files.get(f_id)
+        if file is None:
             continue
+        files_renamed_meta.append({'id': f_id, 'name': new_name, 'prev_name': file.name})
+        file.name = new_name
+        changed_files[f_id] = file
 
     for f_id, deleted in new_props.get('files_deleted', {}).items():
         if not deleted:
             continue
-        try:
-            file = File.objects.get(id=f_id)
-            if not file.deleted_at:
-                files_deleted_meta.append({'id': f_id, 'name': file.name})
-                file.deleted_at = datetime.datetime.now()
-                file.deleted_by = user
-                file.save()
-        except File.DoesNotExist:
-            continue
+        file = files.get(f_id)
+        if file is not None and not file.deleted_at:
+            files_deleted_meta.append({'id': f_id, 'name': file.name})
+            file.deleted_at = datetime.datetime.now()
+            file.deleted_by = user
+            changed_files[f_id] = file
 
     for f_id, restored in new_props.get('files_restored', {}).items():
         if not restored:
             continue
-        try:
-            file = File.objects.get(id=f_id)
-            if file.deleted_at:
-                files_added_meta.append({'id': f_id, 'name': file.name})
-                file.deleted_at = None
-                file.deleted_by = None
-                file.save()
-        except File.DoesNotExist:
-            continue
+        file = files.get(f_id)
+        if file is not None and file.deleted_at:
+            files_added_meta.append({'id': f_id, 'name': file.name})
+            file.deleted_at = None
+            file.deleted_by = None
+            changed_files[f_id] = file
+
+    File.objects.bulk_update(changed_files.values(), ['name', 'deleted_at', 'deleted_by'])
 
     if files_added_meta or files_deleted_meta or files_renamed_meta:
         if files_added_meta:
@@ -381,23 +426,24 @@ def revert_article_version(full_name_or_article: _FullNameOrArticle, rev_number:
         subtypes.append(ArticleLogEntry.LogEntryType.VotesDeleted)
         votes_meta = _get_article_votes_meta(article)
         meta['votes'] = votes_meta
-        with transaction.atomic():
-            Vote.objects.filter(article=article).delete()
-            for vote in new_props['votes']['votes']:
-                try:
-                    vote_visual_group = VisualUserGroup.objects.get(id=vote['visual_group_id'])
-                except VisualUserGroup.DoesNotExist:
-                    vote_visual_group = None
-                try:
-                    vote_user = User.objects.get(id=vote['user_id'])
-                except User.DoesNotExist:
-                    # missing user id means we skip this vote and can't restore it.
-                    continue
-                vote_date = datetime.datetime.fromisoformat(vote['date']) if vote['date'] else None
-                new_vote = Vote(article=article, user=vote_user, date=vote_date, rate=vote['vote'], visual_group=vote_visual_group)
-                new_vote.save()
-                new_vote.date = vote_date
-                new_vote.save()
+        Vote.objects.filter(article=article).delete()
+        saved_votes = new_props['votes']['votes']
+        vote_users = User.objects.in_bulk([vote['user_id'] for vote in saved_votes])
+        vote_visual_groups = VisualUserGroup.objects.in_bulk([vote['visual_group_id'] for vote in saved_votes if vote['visual_group_id'] is not None])
+        new_votes = []
+        vote_dates = []
+        for vote in saved_votes:
+            vote_user = vote_users.get(vote['user_id'])
+            if vote_user is None:
+                # missing user id means we skip this vote and can't restore it.
+                continue
+            new_votes.append(Vote(article=article, user=vote_user, rate=vote['vote'], visual_group=vote_visual_groups.get(vote['visual_group_id'])))
+            vote_dates.append(datetime.datetime.fromisoformat(vote['date']) if vote['date'] else None)
+        new_votes = Vote.objects.bulk_create(new_votes)
+        # date is auto_now_add and is overwritten on insert, so original dates are written afterwards
+        for new_vote, vote_date in zip(new_votes, vote_dates):
+            new_vote.date = vote_date
+        Vote.objects.bulk_update(new_votes, ['date'])
 
     meta['rev_number'] = rev_number
     meta['subtypes'] = subtypes
@@ -414,6 +460,7 @@ def revert_article_version(full_name_or_article: _FullNameOrArticle, rev_number:
 
 
 # Creates new article version for specified article
+@atomic_with_retry
 def create_article_version(full_name_or_article: _FullNameOrArticle, source: str, user: Optional[_UserType] = None, comment: str = "") -> ArticleVersion:
     article = get_article(full_name_or_article)
     is_new = get_latest_version(article) is None
@@ -445,33 +492,35 @@ def create_article_version(full_name_or_article: _FullNameOrArticle, source: str
 
 
 # Refreshes links based on article version.
+# Only the difference between known and current links is written.
 def refresh_article_links(article_version: ArticleVersion):
     article = article_version.article
-    article_name = get_full_name(article)
-    # drop all links known before
-    ExternalLink.objects.filter(link_from=article_name).delete()
     # parse current source
-    already_added = []
-    rc = RenderContext(article=article_version.article, source_article=article_version.article, path_params={}, user=None)
-    linked_pages, included_pages = renderer.single_pass_fetch_backlinks(article_version.source, rc)
-    for linked_page in linked_pages:
-        kt = '%s:include:%s' % (article_name.lower(), linked_page.lower())
-        if kt in already_added:
-            continue
-        already_added.append(kt)
-        new_link = ExternalLink(link_from=article_name.lower(), link_type=ExternalLink.Type.Include, link_to=linked_page.lower())
-        new_link.save()
-    # find links
+    rc = RenderContext(article=article, source_article=article, path_params={}, user=None)
+    included_pages, linked_pages = renderer.single_pass_fetch_backlinks(article_version.source, rc)
+    new_links = set()
     for included_page in included_pages:
-        kt = '%s:link:%s' % (article_name.lower(), included_page.lower())
-        if kt in already_added:
-            continue
-        already_added.append(kt)
-        new_link = ExternalLink(link_from=article_name.lower(), link_type=ExternalLink.Type.Link, link_to=included_page.lower())
-        new_link.save()
+        new_links.add((get_link_target_name(included_page), ArticleLink.Type.Include))
+    for linked_page in linked_pages:
+        new_links.add((get_link_target_name(linked_page), ArticleLink.Type.Link))
+    with transaction.atomic():
+        old_links = {}
+        for link_id, to_name, link_type in ArticleLink.objects.filter(from_article=article).values_list('id', 'to_name', 'link_type'):
+            old_links[(to_name, link_type)] = link_id
+        stale_ids = [link_id for key, link_id in old_links.items() if key not in new_links]
+        if stale_ids:
+            ArticleLink.objects.filter(id__in=stale_ids).delete()
+        missing_links = [key for key in new_links if key not in old_links]
+        if missing_links:
+            article_ids = get_article_ids_by_names([to_name for to_name, _ in missing_links])
+            ArticleLink.objects.bulk_create([
+                ArticleLink(from_article=article, to_article_id=article_ids.get(to_name), to_name=to_name, link_type=link_type)
+                for to_name, link_type in missing_links
+            ], ignore_conflicts=True)
 
 
 # Updates name of article
+@atomic_with_retry
 def update_full_name(full_name_or_article: _FullNameOrArticle, new_full_name: str, user: Optional[_UserType] = None, log: bool = True):
     article = get_article(full_name_or_article)
     prev_full_name = get_full_name(full_name_or_article)
@@ -481,9 +530,9 @@ def update_full_name(full_name_or_article: _FullNameOrArticle, new_full_name: st
     article.name = name
     article.save()
 
-    # update links
-    ExternalLink.objects.filter(link_from__iexact=new_full_name).delete()  # this should not happen, but just to be sure
-    ExternalLink.objects.filter(link_from__iexact=prev_full_name).update(link_from=new_full_name)
+    # update links. links to the old name are now broken, links to the new name now point to this article
+    ArticleLink.objects.filter(to_article=article).update(to_article=None)
+    ArticleLink.objects.filter(to_name=get_link_target_name(new_full_name)).update(to_article=article)
 
     if log:
         log = ArticleLogEntry(
@@ -524,12 +573,14 @@ def _get_article_votes_meta(full_name_or_article: _FullNameOrArticle):
         })
     return votes_meta
 
+@atomic_with_retry
 def delete_article_votes(full_name_or_article: _FullNameOrArticle, user: Optional[_UserType] = None, log: bool = True):
     article = get_article(full_name_or_article)
 
     # fetch existing votes
     votes_meta = _get_article_votes_meta(article)
     Vote.objects.filter(article=article).delete()
+    _emit_on_commit(OnVote(article_id=article.id))
 
     if log:
         log = ArticleLogEntry(
@@ -542,6 +593,7 @@ def delete_article_votes(full_name_or_article: _FullNameOrArticle, user: Optiona
 
 
 # Updates title of article
+@atomic_with_retry
 def update_title(full_name_or_article: _FullNameOrArticle, new_title: str, user: Optional[_UserType] = None):
     article = get_article(full_name_or_article)
     prev_title = article.title
@@ -556,19 +608,16 @@ def update_title(full_name_or_article: _FullNameOrArticle, new_title: str, user:
     add_log_entry(article, log)
 
 
+@atomic_with_retry
 def delete_article(full_name_or_article: _FullNameOrArticle):
     article = get_article(full_name_or_article)
-    ExternalLink.objects.filter(link_from__iexact=get_full_name(full_name_or_article)).delete()
-    article.delete()
-    file_storage = Path(settings.MEDIA_ROOT) / article.site.slug / article.media_name
-    # this may have race conditions with file upload, because filesystem does not know about database transactions
-    for i in range(3):
-        try:
-            if os.path.exists(file_storage):
-                shutil.rmtree(file_storage)
-                break
-        except IOError:  # expected: "directory is not empty" in case someone uploads while we are deleting
-            pass
+    article_id = article.id
+    # outgoing links are removed and incoming links are detached by the database.
+    # deleted through a queryset, so that the instance keeps its id if the transaction is retried
+    Article.objects.filter(id=article_id).delete()
+    _emit_on_commit(OnDeleteArticle(article_id=article_id))
+    # files are removed in background, see web.controllers.media
+    media.schedule_cleanup(media.get_article_media_path(article))
 
 
 # Get specific entry of article
@@ -626,6 +675,7 @@ def get_parent(full_name_or_article: _FullNameOrArticle) -> Optional[str]:
 
 
 # Set parent of article
+@atomic_with_retry
 def set_parent(full_name_or_article: _FullNameOrArticle, full_name_of_parent: _FullNameOrArticle, user: Optional[_UserType] = None):
     article = get_article(full_name_or_article)
     parent = get_article(full_name_of_parent) if full_name_of_parent else None
@@ -648,13 +698,60 @@ def set_parent(full_name_or_article: _FullNameOrArticle, full_name_of_parent: _F
 # Gets all parents
 def get_breadcrumbs(full_name_or_article: _FullNameOrArticle) -> Sequence[Article]:
     article = get_article(full_name_or_article)
-    output = []
-    breadcrumb_ids = []
-    while article and article.id not in breadcrumb_ids:
-        output.append(article)
-        breadcrumb_ids.append(article.id)
-        article = article.parent
-    return list(reversed(output))
+    if not article:
+        return []
+    chain = get_ancestor_chains([article.id]).get(article.id, [])
+    return list(reversed([article] + chain[1:]))
+
+
+# Maximum depth of parent chains, also protects from loops in parent references
+_MAX_ANCESTOR_DEPTH = 64
+
+
+# Get ancestor chains of many articles with one recursive query
+# Returns {article id: [article, parent, grandparent, ...]}; parent of every article in a chain is already loaded,
+# except for the last one of a chain longer than _MAX_ANCESTOR_DEPTH
+def get_ancestor_chains(article_ids: Sequence[int]) -> Dict[int, list[Article]]:
+    article_ids = list(set(article_ids))
+    if not article_ids:
+        return {}
+    table = Article._meta.db_table
+    placeholders = ', '.join(['%s'] * len(article_ids))
+    query = f"""
+        WITH RECURSIVE chain (root_id, article_id, parent_id, depth) AS (
+            SELECT id, id, parent_id, 0 FROM {table} WHERE id IN ({placeholders})
+            UNION ALL
+            SELECT chain.root_id, a.id, a.parent_id, chain.depth + 1
+            FROM chain JOIN {table} a ON a.id = chain.parent_id
+            WHERE chain.depth < %s
+        )
+        SELECT a.*, chain.root_id AS chain_root_id FROM chain JOIN {table} a ON a.id = chain.article_id
+        ORDER BY chain.root_id, chain.depth
+    """
+    parent_field = Article._meta.get_field('parent')
+    chains = {}
+    for article in Article.objects.raw(query, article_ids + [_MAX_ANCESTOR_DEPTH]):
+        chain = chains.setdefault(article.chain_root_id, [])
+        loaded = next((x for x in chain if x.id == article.id), None)
+        if loaded is not None:
+            # parent loop, the rest of the chain repeats. The last article points back into the chain
+            if not parent_field.is_cached(chain[-1]):
+                parent_field.set_cached_value(chain[-1], loaded)
+            continue
+        if chain:
+            parent_field.set_cached_value(chain[-1], article)
+        chain.append(article)
+    return chains
+
+
+# Load parent chains of all given articles with one query, so that article.parent does not query the database
+def prefetch_parents(article_list: Sequence[Article]):
+    chains = get_ancestor_chains([x.id for x in article_list if x.parent_id is not None])
+    parent_field = Article._meta.get_field('parent')
+    for article in article_list:
+        chain = chains.get(article.id)
+        if chain and len(chain) > 1:
+            parent_field.set_cached_value(article, chain[1])
 
 
 # Get page category
@@ -702,6 +799,14 @@ def get_tags(full_name_or_article: _FullNameOrArticle) -> Sequence[str]:
     return list(sorted([x.full_name.lower() for x in get_tags_internal(full_name_or_article)]))
 
 
+# Same as get_tags, but for many articles at once. Returns {article id: [tag names]}
+def get_tags_of_articles(article_ids: Sequence[int]) -> Dict[int, Sequence[str]]:
+    tags = {article_id: [] for article_id in article_ids}
+    for article_tag in Article.tags.through.objects.filter(article_id__in=article_ids).select_related('tag__category'):
+        tags[article_tag.article_id].append(article_tag.tag.full_name.lower())
+    return {article_id: list(sorted(names)) for article_id, names in tags.items()}
+
+
 def get_tags_internal(full_name_or_article: _FullNameOrArticle) -> Sequence[Tag]:
     article = get_article(full_name_or_article)
     if article:
@@ -711,10 +816,18 @@ def get_tags_internal(full_name_or_article: _FullNameOrArticle) -> Sequence[Tag]
 
 def get_tags_categories(full_name_or_article: _FullNameOrArticle) -> Dict[TagsCategory, Sequence[Tag]]:
     article = get_article(full_name_or_article)
-    if article:
-        tags = article.tags.prefetch_related("category").exclude(name__startswith="_")
-        return dict(sorted({category: list(tags.filter(category=category)) for category in set(TagsCategory.objects.prefetch_related("tag_set").filter(tag__in=tags))}.items(), key=lambda x: x[0].priority if x[0].priority is not None else tags.count()))
-    return {}
+    if not article:
+        return {}
+    cache_key = 'tags_categories:%d:%d' % (article.id, article.tags_version)
+    tags_categories = cache.get(cache_key)
+    if tags_categories is None:
+        tags = list(article.tags.select_related('category').exclude(name__startswith='_').exclude(category=None).order_by('name'))
+        grouped = {}
+        for tag in tags:
+            grouped.setdefault(tag.category, []).append(tag)
+        tags_categories = dict(sorted(grouped.items(), key=lambda x: x[0].priority if x[0].priority is not None else len(tags)))
+        cache.set(cache_key, tags_categories, _TAGS_CATEGORIES_CACHE_TIMEOUT)
+    return tags_categories
 
 
 # Set tags for article
@@ -727,23 +840,27 @@ def set_tags(full_name_or_article: _FullNameOrArticle, tags: Sequence[Union[str]
     return set_tags_internal(article, tags, user=user, log=log)
 
 
+@atomic_with_retry
 def set_tags_internal(full_name_or_article: _FullNameOrArticle, tags: Sequence[Tag], user: Optional[_UserType] = None, log: bool = True):
     article = get_article(full_name_or_article)
-    article_tags = article.tags.all()
+    article_tags = list(article.tags.select_related('category'))
 
-    removed_tags = []
-    added_tags = []
+    old_tag_ids = set(tag.id for tag in article_tags)
+    new_tags = {tag.id: tag for tag in tags}
 
-    for tag in article_tags:
-        if tag not in tags:
-            article.tags.remove(tag)
-            removed_tags.append({'id': tag.id, 'name': tag.full_name})
+    removed = [tag for tag in article_tags if tag.id not in new_tags]
+    added = [tag for tag in new_tags.values() if tag.id not in old_tag_ids]
 
-    for tag in tags:
-        if tag not in article_tags:
-            # possibly create the tag here
-            article.tags.add(tag)
-            added_tags.append({'id': tag.id, 'name': tag.full_name})
+    removed_tags = [{'id': tag.id, 'name': tag.full_name} for tag in removed]
+    added_tags = [{'id': tag.id, 'name': tag.full_name} for tag in added]
+
+    if removed:
+        article.tags.remove(*removed)
+    if added:
+        article.tags.add(*added)
+    if removed or added:
+        Article.objects.filter(id=article.id).update(tags_version=F('tags_version') + 1)
+        article.refresh_from_db(fields=['tags_version'])
 
     if (removed_tags or added_tags) and log:
         log = ArticleLogEntry(
@@ -753,22 +870,33 @@ def set_tags_internal(full_name_or_article: _FullNameOrArticle, tags: Sequence[T
             meta={'added_tags': added_tags, 'removed_tags': removed_tags}
         )
         add_log_entry(article, log)
+    elif removed_tags or added_tags:
+        # add_log_entry() emits it otherwise
+        _emit_on_commit(OnEditArticle(article_id=article.id))
 
-    if article.get_settings().creating_tags_allowed:
-        # garbage collect tags if anything was removed
-        Tag.objects.annotate(num_articles=Count('articles')).filter(num_articles=0).delete()
-        TagsCategory.objects.annotate(num_tags=Count('tag')).filter(num_tags=0, slug=F('name')).delete()
+    if removed and article.get_settings().creating_tags_allowed:
+        # garbage collect tags that were removed from this article and are not used anymore
+        Tag.objects.filter(id__in=[tag.id for tag in removed], articles__isnull=True).delete()
+        TagsCategory.objects.filter(id__in=set(tag.category_id for tag in removed), tag__isnull=True, slug=F('name')).delete()
 
 
-# Get article comment info
-# This may actually create a thread if it does not exist yet
+# Get article comment info as (thread id, post count)
+# Thread id is 0 if nobody opened the comments yet, see get_or_create_comment_thread
 def get_comment_info(full_name_or_article: _FullNameOrArticle) -> (int, int):
     article = get_article(full_name_or_article)
     if not article:
         return 0, 0
+    info = ForumThread.objects.filter(article=article).values_list('id', 'post_count').first()
+    return info or (0, 0)
+
+
+# Get comment thread of article, creating it if it does not exist yet
+def get_or_create_comment_thread(full_name_or_article: _FullNameOrArticle) -> Optional[ForumThread]:
+    article = get_article(full_name_or_article)
+    if not article:
+        return None
     thread, _ = ForumThread.objects.get_or_create(article=article)
-    post_count = ForumPost.objects.filter(thread=thread).count()
-    return thread.id, post_count
+    return thread
 
 
 # Get article rating
@@ -789,6 +917,40 @@ def get_rating(full_name_or_article: _FullNameOrArticle) -> (int | float, int, i
         raise ValueError('Unsupported rate type "%s"' % obj_settings.rating_mode)
 
 
+# Same as get_rating, but for many articles at once. Returns {article id: (rating, votes, popularity, mode)}
+def get_ratings(article_list: Sequence[Article]) -> Dict[int, Tuple[int | float, int, int, Settings.RatingMode]]:
+    settings_by_category = {}
+    for article in article_list:
+        category = article.category.lower()
+        if category not in settings_by_category:
+            settings_by_category[category] = article.get_settings()
+    votes = Vote.objects.filter(article_id__in=[x.id for x in article_list])\
+        .order_by()\
+        .values('article_id')\
+        .annotate(
+            sum=Coalesce(Sum('rate'), 0, output_field=IntegerField()),
+            avg=Coalesce(Avg('rate'), 0.0),
+            count=Count('rate'),
+            good_updown=Count('rate', filter=Q(rate=1)),
+            good_stars=Count('rate', filter=Q(rate__gte=3))
+        )
+    votes = {x['article_id']: x for x in votes}
+    ratings = {}
+    for article in article_list:
+        mode = settings_by_category[article.category.lower()].rating_mode
+        data = votes.get(article.id, {})
+        count = data.get('count') or 0
+        if mode == Settings.RatingMode.UpDown:
+            ratings[article.id] = data.get('sum') or 0, count, round((data.get('good_updown') or 0) / (count or 1) * 100), mode
+        elif mode == Settings.RatingMode.Stars:
+            ratings[article.id] = round(data.get('avg') or 0.0, 1) or 0.0, count, round((data.get('good_stars') or 0) / (count or 1) * 100), mode
+        elif mode == Settings.RatingMode.Disabled:
+            ratings[article.id] = 0, 0, 0, mode
+        else:
+            raise ValueError('Unsupported rate type "%s"' % mode)
+    return ratings
+
+
 def get_formatted_rating(full_name_or_article: _FullNameOrArticle) -> str:
     article = get_article(full_name_or_article)
     if not article:
@@ -804,15 +966,18 @@ def get_formatted_rating(full_name_or_article: _FullNameOrArticle) -> str:
         return '%d' % rating
 
 
+@atomic_with_retry
 def add_vote(full_name_or_article: _FullNameOrArticle, user: settings.AUTH_USER_MODEL, rate: int | float | None):
     article = get_article(full_name_or_article)
 
     Vote.objects.filter(article=article, user=user).delete()
     if rate is not None:
         Vote(article=article, user=user, rate=rate, visual_group=user.visual_group).save()
+    _emit_on_commit(OnVote(article_id=article.id))
 
 
 # Set article lock status
+@atomic_with_retry
 def set_lock(full_name_or_article: _FullNameOrArticle, locked: bool, user: Optional[_UserType] = None):
     article = get_article(full_name_or_article)
     article.locked = locked
@@ -840,6 +1005,7 @@ def get_files_in_article(full_name_or_article: _FullNameOrArticle) -> Sequence[F
 
 
 # Add file to article
+@atomic_with_retry
 def add_file_to_article(full_name_or_article: _FullNameOrArticle, file: File, user: Optional[_UserType] = None):
     article = get_article(full_name_or_article)
     if file.article and file.article != article:
@@ -864,6 +1030,7 @@ def get_file_space_usage() -> (int, int):
 # Delete file from article.
 # Permanent deletion is irreversible and should not be used unless for technical cleanup purposes or from admin panel.
 # We also cannot track who performed a permanent deletion.
+@atomic_with_retry
 def delete_file_from_article(full_name_or_article: _FullNameOrArticle, file: File, user: Optional[_UserType] = None, permanent = False):
     article = get_article(full_name_or_article)
     if file.article != article:
@@ -871,9 +1038,9 @@ def delete_file_from_article(full_name_or_article: _FullNameOrArticle, file: Fil
     if file.deleted_at and not permanent:
         raise ValueError('File is already deleted')
     if permanent:
-        if os.path.exists(file.local_media_path):
-            os.unlink(file.local_media_path)
-        file.delete()
+        media.schedule_cleanup(file.local_media_path)
+        # deleted through a queryset, so that the instance keeps its id if the transaction is retried
+        File.objects.filter(id=file.id).delete()
     else:
         file.deleted_at = datetime.datetime.now(datetime.timezone.utc)
         file.deleted_by = user
@@ -888,6 +1055,7 @@ def delete_file_from_article(full_name_or_article: _FullNameOrArticle, file: Fil
 
 
 # Restore deleted file to article
+@atomic_with_retry
 def restore_file_from_article(full_name_or_article: _FullNameOrArticle, file: File, user: Optional[_UserType] = None):
     article = get_article(full_name_or_article)
     if file.article != article:
@@ -907,6 +1075,7 @@ def restore_file_from_article(full_name_or_article: _FullNameOrArticle, file: Fi
 
 
 # Rename file in article
+@atomic_with_retry
 def rename_file_in_article(full_name_or_article: _FullNameOrArticle, file: File, name: str, user: Optional[_UserType] = None):
     article = get_article(full_name_or_article)
     if file.article != article:
@@ -941,16 +1110,17 @@ def is_full_name_allowed(article_name: str) -> bool:
     return True
 
 
+# Returns ids of existing articles by their names, in the form returned by get_link_target_name
+def get_article_ids_by_names(names: Sequence[str]) -> Dict[str, int]:
+    return dict(Article.objects.filter(full_name_key__in=set(names)).values_list('full_name_key', 'id'))
+
+
 # Fetch multiple articles by names
 def fetch_articles_by_names(original_names):
-    names = list(dict.fromkeys([('_default:%s' % x).lower() if ':' not in x else x.lower() for x in original_names]))
-    all_articles = Article.objects.annotate(
-        dumb_name=Lower(Concat('category', Value(':'), 'name', output_field=TextField()))).filter(dumb_name__in=names)
-    ret_map = dict()
-    for article in all_articles:
-        ret_map[article.dumb_name] = article
+    keys = {name: get_link_target_name(name) for name in original_names}
+    ret_map = {article.full_name_key: article for article in Article.objects.filter(full_name_key__in=set(keys.values()))}
     articles_dict = dict()
-    for name in original_names:
-        dumb_name = ('_default:%s' % name).lower() if ':' not in name else name.lower()
-        articles_dict[name] = ret_map[dumb_name]
+    for name, key in keys.items():
+        if key in ret_map:
+            articles_dict[name] = ret_map[key]
     return articles_dict
@@ -0,0 +1,149 @@
+import contextlib
+import fcntl
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction, connection
+
+from web import threadvars
+from web.models.articles import Article
+from web.models.files import File, MediaCleanupTask
+from web.models.sites import Site, get_current_site
+
+
+BACKGROUND_CLEANUP_DELAY = 30
+ORPHAN_SWEEP_DELAY = 60 * 60 * 6
+# files and folders younger than this are not considered orphans, they may belong to an upload in progress
+ORPHAN_GRACE_PERIOD = 60 * 60
+MAX_CLEANUP_ATTEMPTS = 10
+# processes that share MEDIA_ROOT take turns cleaning it up using this file
+CLEANUP_LOCK_NAME = '.cleanup.lock'
+
+
+def get_site_media_path(site: Site) -> Path:
+    return Path(settings.MEDIA_ROOT) / File.escape_media_name(site.slug)
+
+
+def get_article_media_path(article: Article) -> Path:
+    return get_site_media_path(get_current_site()) / File.escape_media_name(str(article.media_name))
+
+
+# Queues file or folder for removal by the background worker.
+# Should be called in the same transaction that removes the database rows, so that the files are not lost track of
+def schedule_cleanup(path: str | Path):
+    path = os.path.relpath(path, settings.MEDIA_ROOT)
+    if path.startswith('..') or os.path.isabs(path):
+        raise ValueError('Path "%s" is outside of MEDIA_ROOT' % path)
+    MediaCleanupTask.objects.create(path=path)
+
+
+def _remove_path(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        os.unlink(path)
+
+
+# Removes queued files, returns number of removed paths
+def process_cleanup_queue(batch_size: int = 50) -> int:
+    with transaction.atomic():
+        tasks = MediaCleanupTask.objects.filter(attempts__lt=MAX_CLEANUP_ATTEMPTS).order_by('attempts', 'created_at')
+        if connection.features.has_select_for_update_skip_locked:
+            # several web workers may drain the queue at the same time
+            tasks = tasks.select_for_update(skip_locked=True)
+        tasks = list(tasks[:batch_size])
+        done = []
+        failed = []
+        for task in tasks:
+            try:
+                _remove_path(Path(settings.MEDIA_ROOT) / task.path)
+                done.append(task.id)
+            except OSError:
+                # expected: "directory is not empty" in case someone uploads while we are deleting
+                logging.warning('Failed to remove %s (attempt %d)', task.path, task.attempts + 1, exc_info=True)
+                task.attempts += 1
+                failed.append(task)
+        MediaCleanupTask.objects.filter(id__in=done).delete()
+        MediaCleanupTask.objects.bulk_update(failed, ['attempts'])
+    return len(done)
+
+
+# Finds files and folders of the site media storage that have no Article or File behind them
+def find_orphan_media(site: Site) -> list[Path]:
+    site_path = get_site_media_path(site)
+    if not site_path.is_dir():
+        return []
+    min_mtime = time.time() - ORPHAN_GRACE_PERIOD
+    article_dirs = {File.escape_media_name(media_name): article_id for article_id, media_name in Article.objects.values_list('id', 'media_name')}
+    file_names = {}
+    for article_id, media_name in File.objects.values_list('article_id', 'media_name'):
+        file_names.setdefault(article_id, set()).add(File.escape_media_name(media_name))
+    orphans = []
+    for article_dir in site_path.iterdir():
+        if article_dir.name not in article_dirs:
+            if article_dir.stat().st_mtime < min_mtime:
+                orphans.append(article_dir)
+            continue
+        if not article_dir.is_dir():
+            continue
+        known_files = file_names.get(article_dirs[article_dir.name], set())
+        for file in article_dir.iterdir():
+            if file.name not in known_files and file.stat().st_mtime < min_mtime:
+                orphans.append(file)
+    return orphans
+
+
+def sweep_orphan_media():
+    for site in Site.objects.all():
+        with threadvars.context():
+            threadvars.put('current_site', site)
+            orphans = find_orphan_media(site)
+            with transaction.atomic():
+                for path in orphans:
+                    schedule_cleanup(path)
+            if orphans:
+                logging.info('Queued %d orphan media paths of %s for removal', len(orphans), site.slug)
+
+
+# Yields False if another process is cleaning up media files, unless blocking is set
+@contextlib.contextmanager
+def cleanup_lock(blocking: bool = False):
+    os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+    with open(os.path.join(settings.MEDIA_ROOT, CLEANUP_LOCK_NAME), 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def background_cleanup():
+    last_sweep = 0
+    while True:
+        try:
+            with cleanup_lock() as locked:
+                if locked:
+                    if time.time() - last_sweep > ORPHAN_SWEEP_DELAY:
+                        last_sweep = time.time()
+                        sweep_orphan_media()
+                    while process_cleanup_queue():
+                        pass
+        except Exception as e:
+            logging.error('Failed to clean up media files', exc_info=e)
+        finally:
+            connection.close()
+        time.sleep(BACKGROUND_CLEANUP_DELAY)
+
+
+def init():
+    t = threading.Thread(target=background_cleanup, daemon=True)
+    t.start()
@@ -0,0 +1,228 @@
+import datetime
+import hashlib
+import json
+import re
+from typing import Optional, Sequence, NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+
+import modules
+from modules import CacheDependency
+from renderer import MAX_INCLUDE_LEVEL
+from renderer.utils import render_user_to_json
+from web.controllers import articles
+from web.events import on_trigger
+from web.models.articles import Article, ArticleLink, ArticleVersion
+from web.models.sites import SiteGeneration, get_current_site
+from web.templatetags.md5url import UrlCache
+
+
+# Pages that contain modules or users can show anything from the site, so their versions include the site generation.
+# Modules are found in page sources together with their params and content, which decide what they depend on
+_MODULE_RE = re.compile(r'\[\[\s*module\s+([\w-]+)((?:\s+[\w-]+\s*=\s*"[^"]*")*)', re.IGNORECASE)
+_MODULE_END_RE = re.compile(r'\[\[\s*/module\s*\]\]', re.IGNORECASE)
+_MODULE_PARAM_RE = re.compile(r'([\w-]+)\s*=\s*"([^"]*)"')
+_USER_RE = re.compile(r'\[\[\s*\*?user\s|%%(created|updated)_by', re.IGNORECASE)
+_SOURCE_INFO_CACHE_TIMEOUT = 60 * 60
+# fields of a user that are shown on pages
+_RENDERED_USER_FIELDS = {'username', 'wikidot_username', 'type', 'avatar', 'is_staff', 'is_superuser', 'is_editor', 'visual_group'}
+
+
+class PageValidator(NamedTuple):
+    etag: str
+    # True if the page is the same for every viewer; pages with modules can depend on the user
+    shared: bool
+    # Everything the modules of the page may depend on. Rendered modules that depend on more make the page uncacheable
+    dependencies: frozenset[CacheDependency]
+
+
+def _get_generation(field: str) -> int:
+    site = get_current_site()
+    return SiteGeneration.objects.filter(site=site).values_list(field, flat=True).first() or 0
+
+
+def _bump_generation(field: str):
+    site = get_current_site(required=False)
+    if site is None:
+        return
+    if not SiteGeneration.objects.filter(site=site).update(**{field: F(field) + 1}):
+        SiteGeneration.objects.get_or_create(site=site, defaults={field: 1})
+
+
+# Get current generation of site content
+def get_site_generation() -> int:
+    return _get_generation('generation')
+
+
+# Increase generation of site content, invalidating versions of all pages with modules
+def bump_site_generation():
+    _bump_generation('generation')
+
+
+# Get current generation of votes on the site
+def get_vote_generation() -> int:
+    return _get_generation('vote_generation')
+
+
+# Increase generation of votes, invalidating versions of pages with modules that depend on ratings
+def bump_vote_generation():
+    _bump_generation('vote_generation')
+
+
+# Users are shared by all sites, so changes to them invalidate pages of every site
+def bump_all_site_generations():
+    SiteGeneration.objects.update(generation=F('generation') + 1)
+
+
+# Called when a user is saved. update_fields is None if the whole user was saved
+def on_user_changed(update_fields: Optional[Sequence[str]]):
+    if update_fields is None or _RENDERED_USER_FIELDS.intersection(update_fields):
+        bump_all_site_generations()
+
+
+@on_trigger(articles.OnCreateArticle)
+@on_trigger(articles.OnEditArticle)
+@on_trigger(articles.OnDeleteArticle)
+def on_content_changed(event):
+    bump_site_generation()
+
+
+# Rating of the page itself is part of its validator, this is for ratings of other pages shown by modules
+@on_trigger(articles.OnVote)
+def on_vote(event):
+    bump_vote_generation()
+
+
+# Names of pages that are rendered around the article: navigation and category template
+def get_frame_page_names(article: Article) -> list[str]:
+    names = ['nav:top', 'nav:side']
+    if article.name != '_template':
+        names.append('%s:_template' % article.category)
+    return names
+
+
+# Follow include links from given articles with one recursive query.
+# Returns ({(included name, article id or None)}, ids of all reached articles)
+def get_included_pages(article_ids: Sequence[int]) -> tuple[set[tuple[str, Optional[int]]], set[int]]:
+    seen = set(article_ids)
+    if not seen:
+        return set(), seen
+    table = ArticleLink._meta.db_table
+    placeholders = ', '.join(['%s'] * len(seen))
+    query = f"""
+        WITH RECURSIVE included (to_name, to_article_id, depth) AS (
+            SELECT to_name, to_article_id, 1 FROM {table} WHERE from_article_id IN ({placeholders}) AND link_type = %s
+            UNION
+            SELECT l.to_name, l.to_article_id, included.depth + 1
+            FROM included JOIN {table} l ON l.from_article_id = included.to_article_id
+            WHERE l.link_type = %s AND included.depth < %s
+        )
+        SELECT DISTINCT to_name, to_article_id FROM included
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(query, list(seen) + [ArticleLink.Type.Include, ArticleLink.Type.Include, MAX_INCLUDE_LEVEL])
+        included = {(to_name, to_article_id) for to_name, to_article_id in cursor.fetchall()}
+    seen |= {to_article_id for _, to_article_id in included if to_article_id is not None}
+    return included, seen
+
+
+def _source_info_key(article_id, updated_at):
+    return 'page_sources:%d:%s' % (article_id, updated_at.timestamp())
+
+
+# Content of a module is taken up to the next module end. Modules without content ignore it
+def _get_source_info(source: str) -> tuple[list[tuple[str, dict[str, str], str]], bool]:
+    found_modules = []
+    for match in _MODULE_RE.finditer(source):
+        params = {key.lower(): value for key, value in _MODULE_PARAM_RE.findall(match[2])}
+        start = source.find(']]', match.end())
+        start = len(source) if start < 0 else start + 2
+        end = _MODULE_END_RE.search(source, start)
+        content = source[start:end.start() if end else len(source)]
+        found_modules.append((match[1].lower(), params, content))
+    return found_modules, bool(_USER_RE.search(source))
+
+
+# Find modules (as (name, params, content)) and user references in latest sources of the articles. Articles are given as {id: updated_at}
+def get_sources_info(updated_at_by_id: dict[int, datetime.datetime]) -> tuple[list[tuple[str, dict[str, str], str]], bool]:
+    keys = {article_id: _source_info_key(article_id, updated_at) for article_id, updated_at in updated_at_by_id.items()}
+    infos = cache.get_many(keys.values())
+    missing = [article_id for article_id, key in keys.items() if key not in infos]
+    if missing:
+        versions = ArticleVersion.objects\
+            .filter(article_id__in=missing)\
+            .defer('ast', 'rendered')\
+            .order_by('article_id', '-created_at')\
+            .distinct('article_id')
+        found = {keys[version.article_id]: _get_source_info(version.source) for version in versions}
+        cache.set_many(found, _SOURCE_INFO_CACHE_TIMEOUT)
+        infos.update(found)
+    found_modules = []
+    has_users = False
+    for info_modules, info_has_users in infos.values():
+        found_modules.extend(info_modules)
+        has_users = has_users or info_has_users
+    return found_modules, has_users
+
+
+# Existing targets of links from given articles as [link name, article id, title]; their existence and titles are rendered
+def get_link_targets(article_ids: Sequence[int]) -> list[list]:
+    links = ArticleLink.objects\
+        .filter(from_article_id__in=article_ids, link_type=ArticleLink.Type.Link, to_article__isnull=False)\
+        .values_list('to_name', 'to_article_id', 'to_article__title')\
+        .distinct()
+    return sorted([list(link) for link in links], key=str)
+
+
+# Compute validator of a rendered article page from everything the page is built from:
+# the article and its parents, navigation and template, included and linked pages, rating and comments and the frontend build.
+# Pages with modules or users also depend on the site generation, and on votes or the viewer if any of their modules does.
+# Returns None if the page has modules that do not declare what they depend on, such pages are always rendered.
+# Data of the viewer is not part of the page itself, see web.views.api.articles.FetchViewerView
+def get_page_validator(article: Article, path_params: dict[str, str], user) -> Optional[PageValidator]:
+    site = get_current_site()
+
+    frames = {name: articles.get_link_target_name(name) for name in get_frame_page_names(article)}
+    frame_articles = {x.full_name_key: x for x in Article.objects.filter(full_name_key__in=frames.values())}
+    ancestors = articles.get_ancestor_chains([article.id]).get(article.id, [article])
+
+    rendered_ids = [article.id] + [x.id for x in frame_articles.values()]
+    included, reached_ids = get_included_pages(rendered_ids)
+    updated_at_by_id = dict(Article.objects.filter(id__in=reached_ids | {x.id for x in ancestors}).values_list('id', 'updated_at'))
+
+    found_modules, has_users = get_sources_info({article_id: updated_at_by_id[article_id] for article_id in reached_ids if article_id in updated_at_by_id})
+    dependencies = set()
+    for name, params, content in found_modules:
+        module_dependencies = modules.module_cache_depends_on(name, params, content)
+        if module_dependencies is None or CacheDependency.Time in module_dependencies:
+            return None
+        dependencies |= module_dependencies
+
+    parts = [
+        UrlCache.get_md5('app.js'),
+        settings.GOOGLE_TAG_ID,
+        [site.id, site.domain, site.title, site.headline, str(site.icon), site.get_settings().creating_tags_allowed],
+        path_params,
+        [article.id, article.full_name, article.locked, article.tags_version, updated_at_by_id[article.id]],
+        [[x.id, updated_at_by_id.get(x.id)] for x in ancestors],
+        [[name, getattr(frame_articles.get(key), 'id', None)] for name, key in frames.items()],
+        sorted(included, key=str),
+        get_link_targets(list(reached_ids)),
+        sorted([article_id, updated_at] for article_id, updated_at in updated_at_by_id.items()),
+        articles.get_rating(article),
+        articles.get_comment_info(article),
+    ]
+
+    if found_modules or has_users:
+        parts.append(get_site_generation())
+    if CacheDependency.Votes in dependencies:
+        parts.append(get_vote_generation())
+    shared = CacheDependency.User not in dependencies
+    if not shared:
+        parts.append(render_user_to_json(user))
+
+    etag = hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest()[:32]
+    return PageValidator(etag=etag, shared=shared, dependencies=frozenset(dependencies))
@@ -84,4 +84,16 @@ export async function fetchArticleVotes(pageId: string): Promise<ModuleRateVotes
 
 export async function deleteArticleVotes(pageId: string): Promise<ModuleRateVotesResponse> {
     return await wFetch<ModuleRateVotesResponse>(`/api/articles/${pageId}/votes`, { method: 'DELETE' })
-}
\ No newline at end of file
+}
+export interface ArticleViewerData {
+    user: UserData
+    editable: boolean
+    lockable: boolean
+    canRate: boolean
+    canComment: boolean
+    canDelete: boolean
+}
+
+export async function fetchArticleViewer(pageId: string): Promise<ArticleViewerData> {
+    return await wFetch<ArticleViewerData>(`/api/articles/${pageId}/viewer`)
+}
@@ -24,6 +24,17 @@ import {makeFootnote} from './articles/footnote'
 import {makeCodeBlock} from "./articles/codeblock";
 import {makeRefForm} from './articles/ref-form'
 import {makeInterwiki} from './articles/interwiki'
+import {ArticleViewerData, fetchArticleViewer} from './api/articles'
+import {UserData} from './api/user'
+
+
+const ANONYMOUS_USER: UserData = {
+    type: 'anonymous',
+    avatar: null,
+    name: 'Anonymous User',
+    username: null,
+    showAvatar: true
+};
 
 
 function renderTo(where: HTMLElement, what: any) {
@@ -35,8 +46,15 @@ function renderTo(where: HTMLElement, what: any) {
 window.addEventListener('DOMContentLoaded', () => {
 
     document.querySelectorAll('#create-new-page').forEach((node: HTMLElement) => renderTo(node, <Page404 {...JSON.parse(node.dataset.config)} />));
-    document.querySelectorAll('#page-options-container').forEach((node: HTMLElement) => renderTo(node, <PageOptions {...JSON.parse(node.dataset.config)} />));
-    document.querySelectorAll('#login-status').forEach((node: HTMLElement) => renderTo(node, <PageLoginStatus {...JSON.parse(node.dataset.config)} />));
+    // page itself is the same for every user, user data and permissions are loaded separately
+    document.querySelectorAll('#login-status').forEach((node: HTMLElement) => {
+        const { pageId } = JSON.parse(node.dataset.config);
+        const renderViewer = (viewer: Partial<ArticleViewerData>) => {
+            renderTo(node, <PageLoginStatus user={viewer.user} />);
+            document.querySelectorAll('#page-options-container').forEach((node: HTMLElement) => renderTo(node, <PageOptions {...JSON.parse(node.dataset.config)} {...viewer} />));
+        };
+        fetchArticleViewer(pageId).then(renderViewer).catch(() => renderViewer({ user: ANONYMOUS_USER }));
+    });
     document.querySelectorAll('.w-forum-new-thread').forEach((node: HTMLElement) => renderTo(node, <ForumNewThread {...JSON.parse(node.dataset.config)} />));
     document.querySelectorAll('.w-forum-new-post').forEach((node: HTMLElement) => renderTo(node, <ForumNewPost {...JSON.parse(node.dataset.config)} />));
     document.querySelectorAll('.w-forum-thread-options').forEach((node: HTMLElement) => renderTo(node, <ForumThreadOptions {...JSON.parse(node.dataset.config)} />));
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from web.controllers import media
+
+
+class Command(BaseCommand):
+    help = 'Removes queued media files and, optionally, media files that do not belong to any article or file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orphans', action='store_true', help='Also look for orphaned media files and folders')
+
+    def handle(self, *args, **options):
+        # waits for the background cleanup of web workers
+        with media.cleanup_lock(blocking=True):
+            if options['orphans']:
+                media.sweep_orphan_media()
+            total = 0
+            while True:
+                removed = media.process_cleanup_queue()
+                if not removed:
+                    break
+                total += removed
+        print('Removed %d media paths' % total)
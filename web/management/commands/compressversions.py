@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from web.models.articles import Article, ArticleVersion
+
+
+class Command(BaseCommand):
+    help = 'Converts plain article versions into compressed keyframes and deltas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-b', '--batch-size', type=int, default=100, help='Number of articles converted per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        article_ids = list(
+            ArticleVersion.objects
+            .filter(storage=ArticleVersion.StorageType.Plain)
+            .order_by('article_id')
+            .values_list('article_id', flat=True)
+            .distinct()
+        )
+        total_versions = 0
+        for i in range(0, len(article_ids), batch_size):
+            with transaction.atomic():
+                for article_id in article_ids[i:i+batch_size]:
+                    total_versions += self.convert_article(article_id)
+            print('Converted %d/%d articles (%d versions)' % (min(i + batch_size, len(article_ids)), len(article_ids), total_versions))
+
+    @staticmethod
+    def convert_article(article_id) -> int:
+        # versions are packed in creation order, each one against the previous one, same as when they are created
+        versions = ArticleVersion.objects.filter(article_id=article_id).defer('ast', 'rendered').order_by('created_at', 'id')
+        fields = ['raw_source', 'storage', 'compression', 'packed_source', 'keyframe', 'base', 'chain_depth']
+        converted = []
+        total = 0
+        prev_version = None
+        for version in versions.iterator(chunk_size=50):
+            if version.storage == ArticleVersion.StorageType.Plain:
+                version.pack_source(prev_version)
+                converted.append(version)
+            prev_version = version
+            if len(converted) >= 50:
+                ArticleVersion.objects.bulk_update(converted, fields)
+                total += len(converted)
+                converted = []
+        ArticleVersion.objects.bulk_update(converted, fields)
+        return total + len(converted)
@@ -0,0 +1,59 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from web import threadvars
+from web.controllers import articles
+from web.models.articles import Article, ArticleLink, ArticleVersion
+from web.models.sites import Site
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds links and includes of all articles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-t', '--threads', type=int, default=4, help='Number of worker threads')
+        parser.add_argument('-c', '--chunk-size', type=int, default=200, help='Number of articles processed by a worker at once')
+
+    def handle(self, *args, **options):
+        site = Site.objects.get()
+        chunk_size = options['chunk_size']
+        article_ids = list(Article.objects.order_by('id').values_list('id', flat=True))
+        chunks = [article_ids[i:i+chunk_size] for i in range(0, len(article_ids), chunk_size)]
+
+        progress_lock = threading.Lock()
+        done = 0
+
+        def worker(chunk):
+            nonlocal done
+            try:
+                with threadvars.context():
+                    threadvars.put('current_site', site)
+                    versions = ArticleVersion.objects\
+                        .select_related('article')\
+                        .filter(article_id__in=chunk)\
+                        .order_by('article_id', '-created_at')\
+                        .distinct('article_id')
+                    for version in versions:
+                        try:
+                            articles.refresh_article_links(version)
+                        except Exception:
+                            logging.error('Failed to refresh links of %s:', version.article.full_name, exc_info=True)
+                with progress_lock:
+                    done += len(chunk)
+                    logging.info('Refreshed links: %d/%d', done, len(article_ids))
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            list(executor.map(worker, chunks))
+
+        # links to pages that were created without going through create_article
+        missing_names = list(ArticleLink.objects.filter(to_article__isnull=True).values_list('to_name', flat=True).distinct())
+        article_ids = articles.get_article_ids_by_names(missing_names)
+        for to_name, article_id in article_ids.items():
+            ArticleLink.objects.filter(to_name=to_name, to_article__isnull=True).update(to_article_id=article_id)
+        logging.info('Resolved links to %d articles', len(article_ids))
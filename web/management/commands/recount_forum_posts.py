@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Subquery
+from django.db.models.functions import Coalesce
+
+from web.models.forum import ForumThread, ForumPost
+
+
+class Command(BaseCommand):
+    help = 'Fixes post counts of forum threads after posts were added or removed bypassing ForumPost.save() and delete()'
+
+    def handle(self, *args, **options):
+        counts = dict(ForumPost.objects.order_by().values('thread_id').annotate(count=Count('id')).values_list('thread_id', 'count'))
+        fixed = 0
+        for thread_id, post_count in ForumThread.objects.values_list('id', 'post_count'):
+            if counts.get(thread_id, 0) == post_count:
+                continue
+            # counted again in the same statement, so that posts added meanwhile are not lost
+            actual = ForumPost.objects.filter(thread_id=thread_id).order_by().values('thread_id').annotate(count=Count('id')).values('count')
+            ForumThread.objects.filter(id=thread_id).update(post_count=Coalesce(Subquery(actual), 0))
+            fixed += 1
+        print('Fixed post counts of %d threads' % fixed)
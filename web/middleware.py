@@ -1,7 +1,6 @@
 from django.conf import settings
-from django.db.models import Q
 from django.http import HttpResponseRedirect
-from web.models.sites import Site
+from web.models.sites import get_site_by_host, get_site_domains
 from web import threadvars
 import django.middleware.csrf
 import urllib.parse
@@ -39,18 +38,19 @@ class MediaHostMiddleware(object):
             raw_host = request.get_host()
             if ':' not in raw_host and 'SERVER_PORT' in request.META:
                 raw_host += ':' + request.META['SERVER_PORT']
-                possible_sites = Site.objects.filter(Q(domain=raw_host) | Q(media_domain=raw_host))
+                site = get_site_by_host(raw_host)
             else:
-                possible_sites = []
-            if not possible_sites:
+                site = None
+            if site is None:
                 # find site by domain
                 raw_host = request.get_host().split(':')[0]
-                possible_sites = Site.objects.filter(Q(domain=raw_host) | Q(media_domain=raw_host))
-                if not possible_sites:
+                site = get_site_by_host(raw_host)
+                if site is None:
                     raise RuntimeError('Site for this domain (\'%s\') is not configured' % raw_host)
 
-            site = possible_sites[0]
             threadvars.put('current_site', site)
+            # values computed once per request by code deeper down, e.g. site generation for module cache keys
+            threadvars.put('request_memo', {})
 
             is_media_host = request.get_host().split(':')[0] == site.media_domain
             is_media_url = request.path.startswith(settings.MEDIA_URL)
@@ -81,7 +81,7 @@ class CsrfViewMiddleware(django.middleware.csrf.CsrfViewMiddleware):
 
     @property
     def csrf_trusted_origins_hosts(self):
-        return [site.domain for site in Site.objects.all()]
+        return get_site_domains()
 
     @property
     def allowed_origins_exact(self):
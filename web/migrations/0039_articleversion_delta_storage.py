@@ -0,0 +1,65 @@
+# Generated by Django 5.1.4 on 2026-10-19 09:25
+
+import auto_prefetch
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0038_alter_site_options_alter_site_managers_and_more'),
+    ]
+
+    operations = [
+        # existing column is kept as is; only the model field is renamed
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RenameField(
+                    model_name='articleversion',
+                    old_name='source',
+                    new_name='raw_source',
+                ),
+                migrations.AlterField(
+                    model_name='articleversion',
+                    name='raw_source',
+                    field=models.TextField(db_column='source', verbose_name='Исходник'),
+                ),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='articleversion',
+            name='raw_source',
+            field=models.TextField(blank=True, db_column='source', null=True, verbose_name='Исходник'),
+        ),
+        migrations.AddField(
+            model_name='articleversion',
+            name='base',
+            field=auto_prefetch.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='+', to='web.articleversion', verbose_name='Предыдущая версия в цепочке'),
+        ),
+        migrations.AddField(
+            model_name='articleversion',
+            name='chain_depth',
+            field=models.PositiveIntegerField(default=0, verbose_name='Глубина в цепочке изменений'),
+        ),
+        migrations.AddField(
+            model_name='articleversion',
+            name='compression',
+            field=models.TextField(blank=True, default='', verbose_name='Сжатие исходника'),
+        ),
+        migrations.AddField(
+            model_name='articleversion',
+            name='keyframe',
+            field=auto_prefetch.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='+', to='web.articleversion', verbose_name='Опорная версия'),
+        ),
+        migrations.AddField(
+            model_name='articleversion',
+            name='packed_source',
+            field=models.BinaryField(blank=True, null=True, verbose_name='Сжатый исходник'),
+        ),
+        migrations.AddField(
+            model_name='articleversion',
+            name='storage',
+            field=models.TextField(choices=[('plain', 'Plain'), ('keyframe', 'Keyframe'), ('delta', 'Delta')], default='plain', verbose_name='Способ хранения исходника'),
+        ),
+    ]
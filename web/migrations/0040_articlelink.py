@@ -0,0 +1,48 @@
+# Generated by Django 5.1.4 on 2026-10-19 09:28
+
+import auto_prefetch
+import django.db.models.deletion
+import django.db.models.manager
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0039_articleversion_delta_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('to_name', models.TextField(verbose_name='Имя целевой статьи')),
+                ('link_type', models.TextField(choices=[('include', 'Include'), ('link', 'Link')], verbose_name='Тип ссылки')),
+                ('from_article', auto_prefetch.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outgoing_links', to='web.article', verbose_name='Ссылающаяся статья')),
+                ('to_article', auto_prefetch.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='incoming_links', to='web.article', verbose_name='Целевая статья')),
+            ],
+            options={
+                'verbose_name': 'Связь',
+                'verbose_name_plural': 'Связи',
+                'abstract': False,
+                'base_manager_name': 'prefetch_manager',
+            },
+            managers=[
+                ('objects', django.db.models.manager.Manager()),
+                ('prefetch_manager', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='articlelink',
+            index=models.Index(fields=['to_article', 'link_type'], name='web_article_to_arti_fa61da_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='articlelink',
+            index=models.Index(fields=['to_name', 'link_type'], name='web_article_to_name_212f65_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='articlelink',
+            constraint=models.UniqueConstraint(fields=('from_article', 'to_name', 'link_type'), name='web_articlelink_unique'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+def copy_external_links(apps, schema_editor):
+    Article = apps.get_model("web", "Article")
+    ExternalLink = apps.get_model("web", "ExternalLink")
+    ArticleLink = apps.get_model("web", "ArticleLink")
+
+    def link_name(full_name):
+        full_name = full_name.lower()
+        if full_name.startswith('_default:'):
+            return full_name[9:]
+        return full_name
+
+    article_ids = {}
+    for article_id, category, name in Article.objects.values_list('id', 'category', 'name'):
+        article_ids[link_name('%s:%s' % (category, name))] = article_id
+
+    batch = []
+    for link in ExternalLink.objects.iterator(chunk_size=1000):
+        from_article_id = article_ids.get(link_name(link.link_from))
+        if from_article_id is None:
+            continue
+        to_name = link_name(link.link_to)
+        batch.append(ArticleLink(from_article_id=from_article_id, to_article_id=article_ids.get(to_name), to_name=to_name, link_type=link.link_type))
+        if len(batch) >= 1000:
+            ArticleLink.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    ArticleLink.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def reverse_func(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0040_articlelink'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_external_links, reverse_func, atomic=True)
+    ]
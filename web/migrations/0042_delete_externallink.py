@@ -0,0 +1,14 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0041_copy_external_links'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='ExternalLink',
+        ),
+    ]
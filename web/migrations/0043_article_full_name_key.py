@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0042_delete_externallink'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='full_name_key',
+            field=models.TextField(null=True, verbose_name='Ключ полного имени'),
+        ),
+    ]
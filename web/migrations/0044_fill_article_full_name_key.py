@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def fill_full_name_key(apps, schema_editor):
+    Article = apps.get_model("web", "Article")
+    batch = []
+    for article in Article.objects.only('id', 'category', 'name').iterator(chunk_size=1000):
+        if article.category.lower() == '_default':
+            article.full_name_key = article.name.lower()
+        else:
+            article.full_name_key = ('%s:%s' % (article.category, article.name)).lower()
+        batch.append(article)
+        if len(batch) >= 1000:
+            Article.objects.bulk_update(batch, ['full_name_key'])
+            batch = []
+    Article.objects.bulk_update(batch, ['full_name_key'])
+
+
+def reverse_func(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0043_article_full_name_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_full_name_key, reverse_func, atomic=True)
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 09:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0045_alter_article_full_name_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forumthread',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество сообщений'),
+        ),
+    ]
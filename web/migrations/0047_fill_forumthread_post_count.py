@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, Count, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_post_count(apps, schema_editor):
+    ForumThread = apps.get_model("web", "ForumThread")
+    ForumPost = apps.get_model("web", "ForumPost")
+    post_counts = ForumPost.objects.filter(thread_id=OuterRef('id')).order_by().values('thread_id').annotate(count=Count('id')).values('count')
+    ForumThread.objects.update(post_count=Coalesce(Subquery(post_counts), Value(0)))
+
+
+def reverse_func(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0046_forumthread_post_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_post_count, reverse_func, atomic=True)
+    ]
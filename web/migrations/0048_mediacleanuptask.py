@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-19 09:35
+
+import django.db.models.manager
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0047_fill_forumthread_post_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaCleanupTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.TextField(verbose_name='Путь в ФС-хранилище')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время создания')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Количество попыток')),
+            ],
+            options={
+                'verbose_name': 'Задача очистки файлов',
+                'verbose_name_plural': 'Задачи очистки файлов',
+                'abstract': False,
+                'base_manager_name': 'prefetch_manager',
+                'indexes': [models.Index(fields=['created_at'], name='web_mediacl_created_3ae454_idx')],
+            },
+            managers=[
+                ('objects', django.db.models.manager.Manager()),
+                ('prefetch_manager', django.db.models.manager.Manager()),
+            ],
+        ),
+    ]
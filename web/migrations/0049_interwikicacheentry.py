@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-19 09:38
+
+import django.db.models.manager
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0048_mediacleanuptask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InterwikiCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.TextField(unique=True, verbose_name='Адрес страницы')),
+                ('data', models.JSONField(blank=True, null=True, verbose_name='Ответ')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('fetched_at', models.DateTimeField(verbose_name='Время получения')),
+            ],
+            options={
+                'verbose_name': 'Кэш интервики',
+                'verbose_name_plural': 'Кэш интервики',
+                'abstract': False,
+                'base_manager_name': 'prefetch_manager',
+            },
+            managers=[
+                ('objects', django.db.models.manager.Manager()),
+                ('prefetch_manager', django.db.models.manager.Manager()),
+            ],
+        ),
+    ]
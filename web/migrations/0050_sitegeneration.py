@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-19 09:45
+
+import auto_prefetch
+import django.db.models.deletion
+import django.db.models.manager
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0049_interwikicacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generation', models.BigIntegerField(default=0, verbose_name='Поколение')),
+                ('site', auto_prefetch.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='generation', to='web.site', verbose_name='Сайт')),
+            ],
+            options={
+                'verbose_name': 'Поколение содержимого сайта',
+                'verbose_name_plural': 'Поколения содержимого сайтов',
+                'abstract': False,
+                'base_manager_name': 'prefetch_manager',
+            },
+            managers=[
+                ('objects', django.db.models.manager.Manager()),
+                ('prefetch_manager', django.db.models.manager.Manager()),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 10:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0050_sitegeneration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='tags_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Версия тегов'),
+        ),
+    ]
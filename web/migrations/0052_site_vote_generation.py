@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 10:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web', '0051_article_tags_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitegeneration',
+            name='vote_generation',
+            field=models.BigIntegerField(default=0, verbose_name='Поколение оценок'),
+        ),
+    ]
@@ -1,3 +1,6 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
 from uuid import uuid4
 
 from system.models import VisualUserGroup
@@ -5,6 +8,7 @@ from system.fields import CITextField
 from django.conf import settings
 import auto_prefetch
 from django.db import models
+from web.util import delta
 from .settings import Settings
 from .sites import Site
 
@@ -105,6 +109,8 @@ class Article(auto_prefetch.Model):
 
     category = models.TextField(default="_default", verbose_name="Категория")
     name = models.TextField(verbose_name="Имя")
+    # lowercase full name, maintained on save. used for case-insensitive lookups by name
+    full_name_key = models.TextField(unique=True, verbose_name="Ключ полного имени")
     title = models.TextField(verbose_name="Заголовок")
 
     parent = auto_prefetch.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Родитель")
@@ -112,6 +118,8 @@ class Article(auto_prefetch.Model):
     author = auto_prefetch.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, blank=True, null=True, verbose_name="Автор")
 
     locked = models.BooleanField(default=False, verbose_name="Страница защищена")
+    # increased on every change of tags, including changes that are not logged and do not update updated_at
+    tags_version = models.PositiveIntegerField(default=0, verbose_name="Версия тегов")
 
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Время создания")
     updated_at = models.DateTimeField(auto_now_add=True, verbose_name="Время изменения")
@@ -136,9 +144,49 @@ class Article(auto_prefetch.Model):
     def display_name(self) -> str:
         return self.title.strip() or self.full_name
 
+    @staticmethod
+    def make_full_name_key(category: str, name: str) -> str:
+        if category.lower() == '_default':
+            return name.lower()
+        return f"{category}:{name}".lower()
+
     def __str__(self) -> str:
         return f"{self.title} ({self.full_name})"
 
+    def save(self, *args, **kwargs):
+        self.full_name_key = Article.make_full_name_key(self.category, self.name)
+        # tags_version is only changed by atomic updates from set_tags_internal, a stale instance must not overwrite it
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [f.name for f in self._meta.concrete_fields if not f.primary_key and f.name != 'tags_version']
+        return super(Article, self).save(*args, **kwargs)
+
+
+# Reconstructed sources of compressed versions. Versions never change after creation, so this is never invalidated
+_SOURCE_CACHE_LIMIT = 32 * 1024 * 1024
+_source_cache = OrderedDict()
+_source_cache_size = 0
+_source_cache_lock = threading.RLock()
+
+
+def _get_cached_source(version_id) -> Optional[str]:
+    with _source_cache_lock:
+        source = _source_cache.get(version_id)
+        if source is not None:
+            _source_cache.move_to_end(version_id)
+        return source
+
+
+def _put_cached_source(version_id, source: str):
+    global _source_cache_size
+    with _source_cache_lock:
+        if version_id in _source_cache:
+            return
+        _source_cache[version_id] = source
+        _source_cache_size += len(source)
+        while _source_cache_size > _SOURCE_CACHE_LIMIT and len(_source_cache) > 1:
+            _, evicted = _source_cache.popitem(last=False)
+            _source_cache_size -= len(evicted)
+
 
 class ArticleVersion(auto_prefetch.Model):
     class Meta(auto_prefetch.Model.Meta):
@@ -147,8 +195,22 @@ class ArticleVersion(auto_prefetch.Model):
 
         indexes = [models.Index(fields=['article', 'created_at'])]
 
+    # plain: source is stored as is in raw_source (legacy rows)
+    # keyframe: full source is stored compressed in packed_source
+    # delta: line-based delta against base version is stored compressed in packed_source
+    class StorageType(models.TextChoices):
+        Plain = 'plain'
+        Keyframe = 'keyframe'
+        Delta = 'delta'
+
     article = auto_prefetch.ForeignKey(Article, on_delete=models.CASCADE, verbose_name="Статья", related_name='versions')
-    source = models.TextField(verbose_name="Исходник")
+    raw_source = models.TextField(db_column='source', null=True, blank=True, verbose_name="Исходник")
+    storage = models.TextField(choices=StorageType.choices, default=StorageType.Plain, verbose_name="Способ хранения исходника")
+    compression = models.TextField(blank=True, default='', verbose_name="Сжатие исходника")
+    packed_source = models.BinaryField(null=True, blank=True, verbose_name="Сжатый исходник")
+    keyframe = auto_prefetch.ForeignKey('self', on_delete=models.RESTRICT, null=True, blank=True, related_name='+', verbose_name="Опорная версия")
+    base = auto_prefetch.ForeignKey('self', on_delete=models.RESTRICT, null=True, blank=True, related_name='+', verbose_name="Предыдущая версия в цепочке")
+    chain_depth = models.PositiveIntegerField(default=0, verbose_name="Глубина в цепочке изменений")
     ast = models.JSONField(blank=True, null=True, verbose_name="AST-дерево статьи")
     rendered = models.TextField(blank=True, null=True, verbose_name="Рендер статьи")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Время создания")
@@ -156,6 +218,96 @@ class ArticleVersion(auto_prefetch.Model):
     def __str__(self) -> str:
         return f"{self.created_at.strftime('%Y-%m-%d, %H:%M:%S')} - {self.article}"
 
+    @property
+    def source(self) -> str:
+        if self.storage == ArticleVersion.StorageType.Plain:
+            return self.raw_source or ''
+        source = _get_cached_source(self.id)
+        if source is None:
+            source = self._reconstruct_source()
+            _put_cached_source(self.id, source)
+        return source
+
+    @source.setter
+    def source(self, value: str):
+        self.raw_source = value
+        self.storage = ArticleVersion.StorageType.Plain
+        self.compression = ''
+        self.packed_source = None
+        self.keyframe = None
+        self.base = None
+        self.chain_depth = 0
+
+    def _unpack(self) -> bytes:
+        return delta.decompress(self.compression, self.packed_source)
+
+    def _reconstruct_source(self) -> str:
+        if self.storage == ArticleVersion.StorageType.Keyframe:
+            return self._unpack().decode('utf-8')
+        # fetch the whole chain at once, then walk from this version back to the keyframe
+        chain = ArticleVersion.objects\
+            .filter(models.Q(id=self.keyframe_id) | models.Q(keyframe_id=self.keyframe_id))\
+            .only('id', 'storage', 'compression', 'packed_source', 'raw_source', 'base_id', 'keyframe_id')
+        chain = {version.id: version for version in chain}
+        chain[self.id] = self
+        deltas = []
+        version = self
+        source = None
+        while version.storage == ArticleVersion.StorageType.Delta:
+            source = _get_cached_source(version.id)
+            if source is not None:
+                break
+            deltas.append(version)
+            version = chain.get(version.base_id)
+            if version is None:
+                raise ValueError('Broken delta chain for version %s' % self.id)
+        if source is None:
+            source = version.source
+        for version in reversed(deltas):
+            source = delta.apply_delta(source, delta.decode_delta(version._unpack()))
+        return source
+
+    def _get_chain_parent(self) -> Optional['ArticleVersion']:
+        return ArticleVersion.objects\
+            .filter(article_id=self.article_id)\
+            .defer('ast', 'rendered')\
+            .order_by('-created_at', '-id')\
+            .first()
+
+    # Packs plain source of this version either as a keyframe or as a delta against the latest version of the article.
+    def pack_source(self, base: Optional['ArticleVersion'] = None):
+        source = self.raw_source or ''
+        packed = None
+        if base is not None and base.storage != ArticleVersion.StorageType.Plain and base.chain_depth + 1 < settings.ARTICLE_VERSION_KEYFRAME_INTERVAL:
+            packed = delta.encode_delta(delta.make_delta(base.source, source))
+            # deltas of mostly rewritten pages are not worth it
+            if len(packed) < len(source.encode('utf-8')) // 2:
+                self.storage = ArticleVersion.StorageType.Delta
+                self.keyframe_id = base.keyframe_id or base.id
+                self.base_id = base.id
+                self.chain_depth = base.chain_depth + 1
+            else:
+                packed = None
+        if packed is None:
+            packed = source.encode('utf-8')
+            self.storage = ArticleVersion.StorageType.Keyframe
+            self.keyframe_id = None
+            self.base_id = None
+            self.chain_depth = 0
+        self.compression, self.packed_source = delta.compress(packed)
+        self.raw_source = None
+        if self.id is not None:
+            _put_cached_source(self.id, source)
+
+    def save(self, *args, **kwargs):
+        source = None
+        if self._state.adding and self.storage == ArticleVersion.StorageType.Plain and settings.ARTICLE_VERSION_STORAGE == 'delta':
+            source = self.raw_source or ''
+            self.pack_source(self._get_chain_parent())
+        super().save(*args, **kwargs)
+        if source is not None:
+            _put_cached_source(self.id, source)
+
 
 class ArticleLogEntry(auto_prefetch.Model):
     class Meta(auto_prefetch.Model.Meta):
@@ -208,22 +360,25 @@ class Vote(auto_prefetch.Model):
         return f"{self.article}: {self.user} - {self.rate}"
 
 
-class ExternalLink(auto_prefetch.Model):
+class ArticleLink(auto_prefetch.Model):
     class Meta(auto_prefetch.Model.Meta):
         verbose_name = "Связь"
         verbose_name_plural = "Связи"
 
         indexes = [
-            models.Index(fields=['link_from', 'link_to']),
-            models.Index(fields=['link_type'])
+            models.Index(fields=['to_article', 'link_type']),
+            models.Index(fields=['to_name', 'link_type']),
         ]
 
-        constraints = [models.UniqueConstraint(fields=['link_from', 'link_to', 'link_type'], name='%(app_label)s_%(class)s_unique')]
+        constraints = [models.UniqueConstraint(fields=['from_article', 'to_name', 'link_type'], name='%(app_label)s_%(class)s_unique')]
 
     class Type(models.TextChoices):
         Include = 'include'
         Link = 'link'
 
-    link_from = models.TextField(verbose_name="Ссылающаяся статья", null=False)
-    link_to = models.TextField(verbose_name="Целевая статья", null=False)
+    from_article = auto_prefetch.ForeignKey(Article, on_delete=models.CASCADE, related_name='outgoing_links', verbose_name="Ссылающаяся статья")
+    # null if target article does not exist (yet)
+    to_article = auto_prefetch.ForeignKey(Article, on_delete=models.SET_NULL, null=True, blank=True, related_name='incoming_links', verbose_name="Целевая статья")
+    # lowercase full name of the target, without _default category
+    to_name = models.TextField(verbose_name="Имя целевой статьи", null=False)
     link_type = models.TextField(choices=Type.choices, verbose_name="Тип ссылки", null=False)
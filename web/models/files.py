@@ -46,3 +46,19 @@ class File(auto_prefetch.Model):
     def local_media_path(self) -> str:
         site = get_current_site()
         return '%s/%s/%s/%s' % (settings.MEDIA_ROOT, self.escape_media_name(site.slug), self.escape_media_name(self.article.media_name), self.escape_media_name(self.media_name))
+
+
+class MediaCleanupTask(auto_prefetch.Model):
+    class Meta(auto_prefetch.Model.Meta):
+        verbose_name = "Задача очистки файлов"
+        verbose_name_plural = "Задачи очистки файлов"
+
+        indexes = [models.Index(fields=['created_at'])]
+
+    # file or folder, relative to MEDIA_ROOT
+    path = models.TextField(verbose_name="Путь в ФС-хранилище")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Время создания")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Количество попыток")
+
+    def __str__(self) -> str:
+        return self.path
@@ -1,7 +1,7 @@
 from django.conf import settings
 import auto_prefetch
 from django.db import models
-from django.db.models import Func, Value
+from django.db.models import Func, Value, F
 from django.db.models.lookups import LessThanOrEqual
 
 from .articles import Article
@@ -65,6 +65,14 @@ class ForumThread(auto_prefetch.Model):
     author = auto_prefetch.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, verbose_name="Автор")
     is_pinned = models.BooleanField(verbose_name="Пришпилено", default=False)
     is_locked = models.BooleanField(verbose_name="Закрыто", default=False)
+    # maintained by ForumPost.save() and delete(). Bulk and queryset changes of posts are fixed by the recount_forum_posts command
+    post_count = models.PositiveIntegerField(verbose_name="Количество сообщений", default=0)
+
+    def save(self, *args, **kwargs):
+        # post_count is only changed by atomic updates from ForumPost, a stale instance must not overwrite it
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [f.name for f in self._meta.concrete_fields if not f.primary_key and f.name != 'post_count']
+        super().save(*args, **kwargs)
 
 
 class ForumPost(auto_prefetch.Model):
@@ -79,6 +87,18 @@ class ForumPost(auto_prefetch.Model):
     reply_to = auto_prefetch.ForeignKey(to='ForumPost', on_delete=models.SET_NULL, null=True, verbose_name="Ответ на комментарий")
     thread = auto_prefetch.ForeignKey(to=ForumThread, on_delete=models.CASCADE, verbose_name="Тема")
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            ForumThread.objects.filter(id=self.thread_id).update(post_count=F('post_count') + 1)
+
+    def delete(self, *args, **kwargs):
+        thread_id = self.thread_id
+        result = super().delete(*args, **kwargs)
+        ForumThread.objects.filter(id=thread_id).update(post_count=F('post_count') - 1)
+        return result
+
 
 class ForumPostVersion(auto_prefetch.Model):
     class Meta(auto_prefetch.Model.Meta):
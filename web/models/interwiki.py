@@ -0,0 +1,17 @@
+import auto_prefetch
+from django.db import models
+
+
+class InterwikiCacheEntry(auto_prefetch.Model):
+    class Meta(auto_prefetch.Model.Meta):
+        verbose_name = "Кэш интервики"
+        verbose_name_plural = "Кэш интервики"
+
+    url = models.TextField(unique=True, verbose_name="Адрес страницы")
+    # either data or error is set; entries with error are negative cache
+    data = models.JSONField(null=True, blank=True, verbose_name="Ответ")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    fetched_at = models.DateTimeField(verbose_name="Время получения")
+
+    def __str__(self) -> str:
+        return self.url
@@ -1,3 +1,5 @@
+import threading
+import time
 from typing import Union, Sequence, Optional
 
 import auto_prefetch
@@ -30,12 +32,70 @@ class Site(SingletonModel):
     def get_settings(self):
         return Settings.objects.filter(site=self).first() or Settings.get_default_settings()
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        invalidate_site_hosts()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        invalidate_site_hosts()
+        return result
+
     def __str__(self) -> str:
         return f"{self.title} ({self.domain})"
 
 
+# Counter of content changes on the site, for everything that can depend on other pages (modules)
+class SiteGeneration(auto_prefetch.Model):
+    class Meta(auto_prefetch.Model.Meta):
+        verbose_name = "Поколение содержимого сайта"
+        verbose_name_plural = "Поколения содержимого сайтов"
+
+    site = auto_prefetch.OneToOneField(Site, on_delete=models.CASCADE, related_name='generation', verbose_name="Сайт")
+    generation = models.BigIntegerField(default=0, verbose_name="Поколение")
+    # votes are frequent and only change output of modules that show or use ratings, so they are counted separately
+    vote_generation = models.BigIntegerField(default=0, verbose_name="Поколение оценок")
+
+
 def get_current_site(required=True) -> Optional[Site]:
     site = threadvars.get('current_site')
     if site is None and required:
         raise ValueError('There is no current site while it was required')
-    return site
\ No newline at end of file
+    return site
+
+
+# Host -> site map used by middlewares on every request.
+# Saving a site resets it in the current process, other processes pick up changes after _SITE_HOSTS_TTL seconds
+_SITE_HOSTS_TTL = 60
+_site_hosts = None
+_site_hosts_loaded_at = 0
+_site_hosts_lock = threading.Lock()
+
+
+def _load_site_hosts():
+    global _site_hosts, _site_hosts_loaded_at
+
+    with _site_hosts_lock:
+        if _site_hosts is None or time.monotonic() - _site_hosts_loaded_at > _SITE_HOSTS_TTL:
+            by_host = {}
+            for site in Site.objects.all():
+                by_host.setdefault(site.domain, site)
+                by_host.setdefault(site.media_domain, site)
+            _site_hosts = by_host
+            _site_hosts_loaded_at = time.monotonic()
+        return _site_hosts
+
+
+def invalidate_site_hosts():
+    global _site_hosts
+
+    with _site_hosts_lock:
+        _site_hosts = None
+
+
+def get_site_by_host(host: str) -> Optional[Site]:
+    return _load_site_hosts().get(host)
+
+
+def get_site_domains() -> Sequence[str]:
+    return list(set(site.domain for site in _load_site_hosts().values()))
@@ -0,0 +1,13 @@
+from web import threadvars
+from web.models.sites import Site
+
+
+# Creates a site and makes it current for the code that tests call outside of requests
+class SiteTestMixin:
+    def setUp(self):
+        super().setUp()
+        self.site = Site.objects.create(slug='test', title='Test', headline='Test', domain='testserver', media_domain='testserver')
+        site_context = threadvars.context()
+        site_context.__enter__()
+        self.addCleanup(site_context.__exit__, None, None, None)
+        threadvars.put('current_site', self.site)
@@ -0,0 +1,16 @@
+from django.test import SimpleTestCase
+
+from web.util.accept_encoding import choose_encoding
+
+
+class ChooseEncodingTest(SimpleTestCase):
+    def test_weights_are_respected(self):
+        self.assertEqual(choose_encoding('gzip, deflate, br', ['br', 'gzip']), 'br')
+        self.assertEqual(choose_encoding('gzip;q=1.0, br;q=0.5', ['br', 'gzip']), 'gzip')
+        self.assertEqual(choose_encoding('br;q=0, gzip', ['br', 'gzip']), 'gzip')
+        self.assertEqual(choose_encoding('*;q=0.5, br;q=0', ['br', 'gzip']), 'gzip')
+
+    def test_nothing_acceptable(self):
+        self.assertEqual(choose_encoding('', ['br', 'gzip']), '')
+        self.assertEqual(choose_encoding('identity', ['br', 'gzip']), '')
+        self.assertEqual(choose_encoding('gzip;q=0', ['gzip']), '')
@@ -0,0 +1,91 @@
+import zlib
+from collections import OrderedDict
+from unittest import mock, skipIf
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from web.controllers import articles
+from web.models import articles as articles_models
+from web.models.articles import ArticleVersion
+from web.tests import SiteTestMixin
+from web.util import delta
+
+
+class DeltaTest(SimpleTestCase):
+    BASE = 'first line\nsecond line\nthird line\nfourth line'
+
+    def assertRoundTrip(self, base, target):
+        ops = delta.decode_delta(delta.encode_delta(delta.make_delta(base, target)))
+        self.assertEqual(delta.apply_delta(base, ops), target)
+
+    def test_round_trip(self):
+        for target in (
+            self.BASE,
+            self.BASE + '\n',
+            'new first line\n' + self.BASE,
+            self.BASE.replace('second line\n', ''),
+            self.BASE.replace('third line', 'changed line\nand one more'),
+            self.BASE.replace('\n', '\r\n'),
+            'совсем другой текст',
+            '',
+        ):
+            with self.subTest(target=target):
+                self.assertRoundTrip(self.BASE, target)
+                self.assertRoundTrip(target, self.BASE)
+
+    def test_unchanged_lines_are_copied(self):
+        ops = delta.make_delta(self.BASE, self.BASE.replace('third line', 'changed line'))
+        self.assertEqual(ops, [[0, 2], 'changed line\n', [3, 4]])
+
+    def test_compression(self):
+        data = ('line of text\n' * 100).encode('utf-8')
+        codec, compressed = delta.compress(data)
+        self.assertLess(len(compressed), len(data))
+        self.assertEqual(delta.decompress(codec, compressed), data)
+        self.assertEqual(delta.decompress('zlib', zlib.compress(data)), data)
+        self.assertEqual(delta.decompress('', data), data)
+
+    @skipIf(delta.pyzstd is None, 'pyzstd is not installed')
+    def test_zstd_compression(self):
+        data = ('line of text\n' * 100).encode('utf-8')
+        self.assertEqual(delta.decompress('zstd', delta.pyzstd.compress(data)), data)
+
+
+@override_settings(ARTICLE_VERSION_STORAGE='delta', ARTICLE_VERSION_KEYFRAME_INTERVAL=4)
+class DeltaStorageTest(SiteTestMixin, TestCase):
+    VERSIONS = 10
+
+    def setUp(self):
+        super().setUp()
+        self.article = articles.create_article('versioned-page')
+        lines = ['line %d of the page\n' % i for i in range(50)]
+        self.sources = []
+        for i in range(self.VERSIONS):
+            lines[i * 3] = 'line %d changed in version %d\n' % (i * 3, i)
+            self.sources.append(''.join(lines))
+            articles.create_article_version(self.article, self.sources[-1])
+
+    # read sources from the database, without the reconstructed sources cached by this process
+    def _load_sources(self):
+        with mock.patch.object(articles_models, '_source_cache', OrderedDict()):
+            versions = ArticleVersion.objects.filter(article=self.article).order_by('created_at', 'id')
+            return [(version.storage, version.source) for version in versions]
+
+    def test_versions_are_stored_as_keyframe_chains(self):
+        versions = self._load_sources()
+        self.assertEqual([storage for storage, _ in versions], [
+            ArticleVersion.StorageType.Keyframe, ArticleVersion.StorageType.Delta, ArticleVersion.StorageType.Delta, ArticleVersion.StorageType.Delta,
+            ArticleVersion.StorageType.Keyframe, ArticleVersion.StorageType.Delta, ArticleVersion.StorageType.Delta, ArticleVersion.StorageType.Delta,
+            ArticleVersion.StorageType.Keyframe, ArticleVersion.StorageType.Delta,
+        ])
+        self.assertEqual([source for _, source in versions], self.sources)
+
+    def test_revert_across_keyframe(self):
+        # version of rev 1 is in the first chain, the latest version is two keyframes later
+        articles.revert_article_version(self.article, 1)
+
+        versions = self._load_sources()
+        self.assertEqual(len(versions), self.VERSIONS + 1)
+        self.assertEqual(versions[-1][1], self.sources[1])
+        self.assertEqual(articles.get_latest_source(self.article), self.sources[1])
+        self.assertEqual([source for _, source in versions[:-1]], self.sources)
@@ -0,0 +1,87 @@
+import threading
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from web.controllers import articles
+from web.models.articles import ArticleLogEntry
+from web.tests import SiteTestMixin
+
+
+class DeduplicateNameTest(SiteTestMixin, TestCase):
+    def test_first_free_number_is_used(self):
+        for name in ('scp-1', 'scp-1-2', 'scp-1-other', 'scp-10', 'scp-1-4'):
+            articles.create_article(name)
+        self.assertEqual(articles.deduplicate_name('scp-1'), 'scp-1-3')
+        self.assertEqual(articles.deduplicate_name('SCP-1-other'), 'SCP-1-other-2')
+        self.assertEqual(articles.deduplicate_name('scp-2'), 'scp-2')
+
+    def test_allowed_article_keeps_its_name(self):
+        article = articles.create_article('scp-1')
+        articles.create_article('scp-1-2')
+        self.assertEqual(articles.deduplicate_name('scp-1', article), 'scp-1')
+
+
+class TagsCategoriesTest(SiteTestMixin, TestCase):
+    def _tag_names(self, full_name):
+        tags_categories = articles.get_tags_categories(articles.get_article(full_name))
+        return sorted(tag.name for tags in tags_categories.values() for tag in tags)
+
+    def test_tag_changes_without_log_are_shown(self):
+        article = articles.create_article('tagged-page')
+        tale, humor = articles.get_tag('tale', create=True), articles.get_tag('humor', create=True)
+
+        articles.set_tags_internal(article, [tale], log=False)
+        self.assertEqual(self._tag_names('tagged-page'), ['tale'])
+        articles.set_tags_internal(article, [tale, humor], log=False)
+        self.assertEqual(self._tag_names('tagged-page'), ['humor', 'tale'])
+        articles.set_tags_internal(article, [humor])
+        self.assertEqual(self._tag_names('tagged-page'), ['humor'])
+        self.assertEqual(ArticleLogEntry.objects.filter(article=article).count(), 1)
+
+    def test_stale_instance_keeps_tags_version(self):
+        articles.create_article('tagged-page')
+        stale = articles.get_article('tagged-page')
+        self.assertEqual(self._tag_names('tagged-page'), [])
+        articles.set_tags_internal(articles.get_article('tagged-page'), [articles.get_tag('tale', create=True)], log=False)
+        stale.title = 'Renamed'
+        stale.save()
+        self.assertEqual(self._tag_names('tagged-page'), ['tale'])
+
+
+class ConcurrentLogEntriesTest(SiteTestMixin, TransactionTestCase):
+    WORKERS = 8
+    ENTRIES_PER_WORKER = 5
+
+    def test_rev_numbers_are_unique_and_contiguous(self):
+        article = articles.create_article('concurrent-page')
+        barrier = threading.Barrier(self.WORKERS)
+        errors = []
+
+        def add_entries(worker):
+            try:
+                barrier.wait()
+                for i in range(self.ENTRIES_PER_WORKER):
+                    title = 'title %d-%d' % (worker, i)
+                    log = ArticleLogEntry(
+                        article=articles.get_article('concurrent-page'),
+                        type=ArticleLogEntry.LogEntryType.Title,
+                        meta={'title': title, 'prev_title': ''}
+                    )
+                    articles.add_log_entry('concurrent-page', log)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=add_entries, args=(worker,)) for worker in range(self.WORKERS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        rev_numbers = list(ArticleLogEntry.objects.filter(article=article).order_by('rev_number').values_list('rev_number', flat=True))
+        self.assertEqual(rev_numbers, list(range(self.WORKERS * self.ENTRIES_PER_WORKER)))
+        titles = set(ArticleLogEntry.objects.filter(article=article).values_list('meta__title', flat=True))
+        self.assertEqual(len(titles), self.WORKERS * self.ENTRIES_PER_WORKER)
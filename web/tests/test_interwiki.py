@@ -0,0 +1,183 @@
+import datetime
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.test import TransactionTestCase
+
+from shared_data import interwiki_batcher
+from web.models.interwiki import InterwikiCacheEntry
+
+
+SITES = [{'language': 'en', 'url': 'https://scp-wiki.wikidot.com', 'type': 'OFFICIAL', 'displayName': 'English'}]
+
+
+# Stand-in for the GraphQL API: answers batched queries, pages with "missing" in their url fail
+class GraphQLStubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        queries = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.batches.append(queries)
+        if self.server.fail:
+            self.send_response(500)
+            self.end_headers()
+            return
+        results = []
+        for query in queries:
+            url = query.get('variables', {}).get('url')
+            if url is None:
+                results.append({'data': {'sites': SITES}})
+            elif 'missing' in url:
+                results.append({'data': None, 'errors': [{'message': 'page not found: %s' % url}]})
+            else:
+                results.append({'data': {'page': {'translations': [{'url': url + '-ru'}], 'translationOf': None}}})
+        body = json.dumps(results).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class InterwikiServiceTest(TransactionTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), GraphQLStubHandler)
+        self.server.batches = []
+        self.server.fail = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        api_url = 'http://127.0.0.1:%d/graphql' % self.server.server_address[1]
+        patcher = mock.patch.object(interwiki_batcher, 'INTERWIKI_API_URL', api_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = interwiki_batcher.InterwikiService()
+
+    def _query_in_background(self, url):
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(response=self.service.query(url, timeout=10)))
+        thread.start()
+        return thread, result
+
+    def _wait_until_queued(self, count):
+        for _ in range(500):
+            with self.service.lock:
+                if len(self.service.pending) >= count:
+                    return
+            threading.Event().wait(0.01)
+        self.fail('queries were not queued')
+
+    def test_queries_are_batched_and_split(self):
+        urls = ['http://a.wikidot.com/one', 'http://a.wikidot.com/two', 'http://a.wikidot.com/missing']
+        queries = [self._query_in_background(url) for url in urls]
+        self._wait_until_queued(len(urls))
+        # the same url is asked once
+        with self.service.lock:
+            pending = dict(self.service.pending)
+        self.assertIs(self.service._enqueue(urls[0]), pending[urls[0]])
+        self.service.process_batch()
+        for thread, _ in queries:
+            thread.join()
+
+        # one upstream request for all urls, plus the query of the site list
+        self.assertEqual(len(self.server.batches), 1)
+        self.assertEqual(len(self.server.batches[0]), len(urls) + 1)
+
+        responses = [result['response'] for _, result in queries]
+        self.assertEqual(responses[0]['data']['page']['translations'], [{'url': urls[0] + '-ru'}])
+        self.assertEqual(responses[0]['data']['sites'], SITES)
+        self.assertEqual(responses[1]['data']['page']['translations'], [{'url': urls[1] + '-ru'}])
+        self.assertEqual(responses[2]['errors'][0]['message'], 'page not found: %s' % urls[2])
+
+        entries = {entry.url: entry for entry in InterwikiCacheEntry.objects.all()}
+        self.assertEqual(set(entries), set(urls))
+        self.assertEqual(entries[urls[0]].data['sites'], SITES)
+        self.assertEqual(entries[urls[0]].error, '')
+        self.assertIsNone(entries[urls[2]].data)
+        self.assertEqual(entries[urls[2]].error, 'page not found: %s' % urls[2])
+
+    def test_failed_batch_is_cached_as_error(self):
+        self.server.fail = True
+        url = 'http://a.wikidot.com/one'
+        thread, result = self._query_in_background(url)
+        self._wait_until_queued(1)
+        self.service.process_batch()
+        thread.join()
+
+        self.assertTrue(result['response']['errors'])
+        entry = InterwikiCacheEntry.objects.get(url=url)
+        self.assertIsNone(entry.data)
+        self.assertTrue(entry.error)
+
+    def test_cache_entries_are_reused(self):
+        url = 'http://a.wikidot.com/one'
+        data = {'page': {'translations': [], 'translationOf': None}, 'sites': SITES}
+        InterwikiCacheEntry.objects.create(url=url, data=data, fetched_at=datetime.datetime.now(datetime.timezone.utc))
+
+        self.assertEqual(self.service.query(url, timeout=1), {'data': data})
+        self.assertEqual(interwiki_batcher.InterwikiService().query(url, timeout=1), {'data': data})
+        self.assertEqual(self.server.batches, [])
+        self.assertEqual(self.service.pending, {})
+
+    def test_stale_entries_are_served_and_refreshed(self):
+        url = 'http://a.wikidot.com/one'
+        stale_data = {'page': {'translations': [], 'translationOf': None}, 'sites': SITES}
+        fetched_at = datetime.datetime.now(datetime.timezone.utc) - interwiki_batcher.CACHE_TTL - datetime.timedelta(minutes=1)
+        InterwikiCacheEntry.objects.create(url=url, data=stale_data, fetched_at=fetched_at)
+
+        self.assertEqual(self.service.query(url, timeout=1), {'data': stale_data})
+        self.assertIn(url, self.service.pending)
+        self.service.process_batch()
+
+        entry = InterwikiCacheEntry.objects.get(url=url)
+        self.assertEqual(entry.data['page']['translations'], [{'url': url + '-ru'}])
+        self.assertGreater(entry.fetched_at, fetched_at)
+        self.assertEqual(self.service.query(url, timeout=1)['data']['page']['translations'], [{'url': url + '-ru'}])
+
+    def test_failed_refresh_keeps_stale_data(self):
+        self.server.fail = True
+        url = 'http://a.wikidot.com/one'
+        stale_data = {'page': {'translations': [], 'translationOf': None}, 'sites': SITES}
+        fetched_at = datetime.datetime.now(datetime.timezone.utc) - interwiki_batcher.CACHE_TTL - datetime.timedelta(minutes=1)
+        InterwikiCacheEntry.objects.create(url=url, data=stale_data, fetched_at=fetched_at)
+
+        self.assertEqual(self.service.query(url, timeout=1), {'data': stale_data})
+        self.service.process_batch()
+        self.assertEqual(len(self.server.batches), 1)
+
+        entry = InterwikiCacheEntry.objects.get(url=url)
+        self.assertEqual(entry.data, stale_data)
+        self.assertEqual(entry.error, '')
+        self.assertGreater(entry.fetched_at, fetched_at)
+        self.assertEqual(self.service.query(url, timeout=1), {'data': stale_data})
+        with mock.patch.object(interwiki_batcher, 'MEMORY_CACHE_TTL', 0):
+            self.assertEqual(self.service.query(url, timeout=1), {'data': stale_data})
+        # retried after NEGATIVE_CACHE_TTL, not on every query
+        self.assertEqual(self.service.pending, {})
+
+    def test_memory_cache_is_checked_against_database(self):
+        url = 'http://a.wikidot.com/one'
+        data = {'page': {'translations': [], 'translationOf': None}, 'sites': SITES}
+        InterwikiCacheEntry.objects.create(url=url, data=data, fetched_at=datetime.datetime.now(datetime.timezone.utc))
+        self.assertEqual(self.service.query(url, timeout=1), {'data': data})
+
+        # removed in the admin panel
+        InterwikiCacheEntry.objects.filter(url=url).delete()
+        self.assertEqual(self.service.query(url, timeout=1), {'data': data})
+        with mock.patch.object(interwiki_batcher, 'MEMORY_CACHE_TTL', 0):
+            self.assertTrue(self.service.query(url, timeout=0.1)['errors'])
+        self.assertIn(url, self.service.pending)
+        self.assertNotIn(url, self.service.cache)
+
+    def test_memory_cache_is_bounded(self):
+        urls = ['http://a.wikidot.com/%d' % i for i in range(3)]
+        with mock.patch.object(interwiki_batcher, 'MEMORY_CACHE_SIZE', 2):
+            self.service.store_results({url: {'data': {'sites': SITES}} for url in urls[:2]})
+            # recently used entries are kept
+            self.service.query(urls[0], timeout=1)
+            self.service.store_results({urls[2]: {'data': {'sites': SITES}}})
+        self.assertEqual(list(self.service.cache), [urls[0], urls[2]])
+        self.assertEqual(InterwikiCacheEntry.objects.count(), 3)
@@ -0,0 +1,44 @@
+from django.test import TestCase
+
+from system.models import User
+from web.controllers import articles, page_versions
+from web.tests import SiteTestMixin
+
+
+class VoteValidatorTest(SiteTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', password='alice')
+        self.voted = articles.create_article('voted-page', self.alice)
+
+    def _etag(self, source):
+        article = articles.create_article(articles.deduplicate_name('listing'), self.alice)
+        articles.create_article_version(article, source, self.alice)
+        return lambda: page_versions.get_page_validator(article, {}, self.alice).etag
+
+    def _vote(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            articles.add_vote(self.voted, self.alice, 1)
+
+    def test_votes_only_change_pages_that_use_ratings(self):
+        by_rating = self._etag('[[module ListPages order="rating desc"]]\n%%title%%\n[[/module]]')
+        with_rating = self._etag('[[module ListPages]]\n%%title%% %%rating%%\n[[/module]]')
+        by_title = self._etag('[[module ListPages order="title"]]\n%%title%%\n[[/module]]')
+        etags = by_rating(), with_rating(), by_title()
+
+        self._vote()
+        self.assertNotEqual(by_rating(), etags[0])
+        self.assertNotEqual(with_rating(), etags[1])
+        self.assertEqual(by_title(), etags[2])
+
+    def test_changes_without_log_invalidate_modules(self):
+        site_generation = page_versions.get_site_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            articles.set_tags_internal(self.voted, [articles.get_tag('tale', create=True)], log=False)
+        self.assertGreater(page_versions.get_site_generation(), site_generation)
+
+        self._vote()
+        vote_generation = page_versions.get_vote_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            articles.delete_article_votes(self.voted, log=False)
+        self.assertGreater(page_versions.get_vote_generation(), vote_generation)
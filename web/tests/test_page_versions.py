@@ -0,0 +1,52 @@
+from unittest import skipIf
+
+from django.test import TestCase, Client
+
+from ftml import ftml
+from system.models import User
+from web.controllers import articles
+from web.tests import SiteTestMixin
+
+
+@skipIf(ftml is None, 'ftml is not built')
+class SharedPageTest(SiteTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice', password='alice')
+        self.bob = User.objects.create_user('bob', password='bob')
+        article = articles.create_article('shared-page', self.alice)
+        articles.create_article_version(article, 'Some **text** and a [[[missing-page|link]]]', self.alice)
+
+    def _client(self, user):
+        client = Client(HTTP_HOST='testserver')
+        client.force_login(user)
+        return client
+
+    def test_page_is_same_for_every_viewer(self):
+        alice = self._client(self.alice)
+        bob = self._client(self.bob)
+
+        alice_page = alice.get('/shared-page')
+        bob_page = bob.get('/shared-page')
+        self.assertEqual(alice_page.status_code, 200)
+        self.assertEqual(alice_page['ETag'], bob_page['ETag'])
+        self.assertEqual(alice_page.content, bob_page.content)
+        self.assertNotIn(b'alice', alice_page.content)
+
+        alice_viewer = alice.get('/api/articles/shared-page/viewer')
+        bob_viewer = bob.get('/api/articles/shared-page/viewer')
+        self.assertEqual(alice_viewer.json()['user']['username'], 'alice')
+        self.assertEqual(bob_viewer.json()['user']['username'], 'bob')
+        self.assertNotEqual(alice_viewer.content, bob_viewer.content)
+        self.assertIn('no-store', alice_viewer['Cache-Control'])
+
+    def test_page_depending_on_viewer_is_not_shared(self):
+        article = articles.get_article('shared-page')
+        articles.create_article_version(article, '[[module ListPages created_by="."]]\nListed-%%title%%\n[[/module]]', self.alice)
+
+        alice_page = self._client(self.alice).get('/shared-page')
+        bob_page = self._client(self.bob).get('/shared-page')
+        self.assertEqual(alice_page.status_code, 200)
+        self.assertNotEqual(alice_page['ETag'], bob_page['ETag'])
+        self.assertIn(b'Listed-shared-page', alice_page.content)
+        self.assertNotIn(b'Listed-shared-page', bob_page.content)
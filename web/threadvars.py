@@ -1,53 +1,53 @@
-# This file implements global variables per thread
+# This file implements global variables per thread (or per asyncio task)
 # This is so that the state doesn't need to be passed down to each and every handler.
-import threading
-import copy
+#
+# Each context() is a layer on top of the enclosing one. Values are read through the layers,
+# put() only replaces the innermost layer, so nested contexts never leak values to their parents.
+# Layers are never mutated in place, which makes them safe to share between copied contexts.
+import contextvars
 
 
-_CONTEXTS_LOCK = threading.RLock()
-_CONTEXTS = dict()
+class _Layer(object):
+    __slots__ = ('values', 'parent')
+
+    def __init__(self, values, parent):
+        self.values = values
+        self.parent = parent
+
+
+_CURRENT = contextvars.ContextVar('threadvars', default=None)
 
 
 def register():
-    with _CONTEXTS_LOCK:
-        t = threading.current_thread().ident
-        parent = _CONTEXTS.get(t)
-        new_dict = copy.copy(parent or dict())
-        new_dict['__parent'] = parent
-        _CONTEXTS[t] = new_dict
-        return True
+    _CURRENT.set(_Layer({}, _CURRENT.get()))
+    return True
 
 
 def unregister():
-    with _CONTEXTS_LOCK:
-        t = threading.current_thread().ident
-        if t in _CONTEXTS:
-            parent = _CONTEXTS[t]['__parent']
-            if parent:
-                _CONTEXTS[t] = parent
-            else:
-                del _CONTEXTS[t]
+    layer = _CURRENT.get()
+    if layer is not None:
+        _CURRENT.set(layer.parent)
 
 
 def registered():
-    with _CONTEXTS_LOCK:
-        t = threading.current_thread().ident
-        return t in _CONTEXTS
+    return _CURRENT.get() is not None
 
 
 def get(key, default=None):
-    with _CONTEXTS_LOCK:
-        t = threading.current_thread().ident
-        if t in _CONTEXTS:
-            return _CONTEXTS[t].get(key, default)
-        return default
+    layer = _CURRENT.get()
+    while layer is not None:
+        if key in layer.values:
+            return layer.values[key]
+        layer = layer.parent
+    return default
 
 
 def put(key, value):
-    with _CONTEXTS_LOCK:
-        t = threading.current_thread().ident
-        if t in _CONTEXTS:
-            _CONTEXTS[t][key] = value
+    layer = _CURRENT.get()
+    if layer is not None:
+        values = dict(layer.values)
+        values[key] = value
+        _CURRENT.set(_Layer(values, layer.parent))
 
 
 class ThreadVarsContext(object):
@@ -55,12 +55,13 @@ class ThreadVarsContext(object):
         pass
 
     def __enter__(self):
+        self.previous = _CURRENT.get()
         self.registered = register()
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
         if self.registered:
-            unregister()
+            _CURRENT.set(self.previous)
         return False
 
 
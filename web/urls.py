@@ -28,6 +28,7 @@ api_patterns = [
     path('articles/<str:full_name>/log', articles.FetchOrRevertLogView.as_view()),
     path('articles/<str:full_name>/links', articles.FetchExternalLinks.as_view()),
     path('articles/<str:full_name>/votes', articles.FetchOrUpdateVotesView.as_view()),
+    path('articles/<str:full_name>/viewer', articles.FetchViewerView.as_view()),
 
     path('articles/<str:article_name>/files', files.GetOrUploadView.as_view()),
     path('files/<int:file_id>', files.RenameOrDeleteView.as_view()),
@@ -1,14 +1,48 @@
-from contextlib import contextmanager
-from django.db import transaction
+import contextlib
+import functools
+import logging
+import random
+import time
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction, OperationalError
+from django.db.models import Model
 from django.db.transaction import get_connection
 
 
-@contextmanager
-def lock_table(model):
-    with transaction.atomic():
-        cursor = get_connection().cursor()
-        cursor.execute(f'SELECT 0 FROM {model._meta.db_table} LIMIT 1 FOR UPDATE')
-        try:
-            yield
-        finally:
-            cursor.close()
+def is_serialization_failure(e: Exception) -> bool:
+    cause = e.__cause__
+    # psycopg2 exposes pgcode, psycopg 3 exposes sqlstate
+    code = getattr(cause, 'sqlstate', None) or getattr(cause, 'pgcode', None)
+    return code == '40001'
+
+
+# Runs the decorated function in a transaction and restarts it when the database reports a serialization failure.
+# CockroachDB runs everything as SERIALIZABLE and asks the client to retry conflicting transactions.
+# A transaction can only be retried as a whole, so when called inside of another atomic block the function
+# is simply executed as part of it and the outermost caller is responsible for retrying.
+# Model instances given as arguments are reloaded before retrying, as the failed attempt could have changed them in memory.
+def atomic_with_retry(func=None, *, attempts=5):
+    if func is None:
+        return functools.partial(atomic_with_retry, attempts=attempts)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if get_connection().in_atomic_block:
+            with transaction.atomic():
+                return func(*args, **kwargs)
+        for attempt in range(attempts):
+            try:
+                with transaction.atomic():
+                    return func(*args, **kwargs)
+            except OperationalError as e:
+                if attempt + 1 >= attempts or not is_serialization_failure(e):
+                    raise
+                logging.warning('Retrying %s after serialization failure (attempt %d)', func.__name__, attempt + 1)
+                time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+                for arg in list(args) + list(kwargs.values()):
+                    if isinstance(arg, Model) and arg.pk is not None:
+                        # instances created by the failed attempt do not exist anymore
+                        with contextlib.suppress(ObjectDoesNotExist):
+                            arg.refresh_from_db()
+
+    return wrapper
@@ -0,0 +1,30 @@
+# Parse Accept-Encoding header, e.g. "gzip;q=1.0, br;q=0.5, *;q=0", into weights of content codings
+def parse_accept_encoding(header: str) -> dict[str, float]:
+    weights = {}
+    for item in header.split(','):
+        coding, *params = item.split(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value.strip())
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    return weights
+
+
+# Pick the encoding with the highest weight out of available ones, which are given in order of preference.
+# Returns '' (no encoding) if none of them is acceptable
+def choose_encoding(header: str, available: list[str]) -> str:
+    weights = parse_accept_encoding(header)
+    best, best_weight = '', 0.0
+    for encoding in available:
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
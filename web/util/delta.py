@@ -0,0 +1,62 @@
+import difflib
+import json
+import zlib
+
+try:
+    import pyzstd
+except ImportError:
+    pyzstd = None
+
+
+# Line-based deltas between two texts.
+# A delta is a list of operations; [start, end] copies lines start..end of the base text, a string is inserted as is.
+def make_delta(base: str, target: str) -> list:
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, target_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif tag in ('replace', 'insert'):
+            ops.append(''.join(target_lines[j1:j2]))
+    return ops
+
+
+def apply_delta(base: str, ops: list) -> str:
+    base_lines = base.splitlines(keepends=True)
+    output = []
+    for op in ops:
+        if isinstance(op, str):
+            output.append(op)
+        else:
+            output.extend(base_lines[op[0]:op[1]])
+    return ''.join(output)
+
+
+def encode_delta(ops: list) -> bytes:
+    return json.dumps(ops, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def decode_delta(data: bytes) -> list:
+    return json.loads(data.decode('utf-8'))
+
+
+# Returns (codec, compressed data). zstd is used when available, zlib otherwise
+def compress(data: bytes) -> tuple[str, bytes]:
+    if pyzstd is not None:
+        return 'zstd', pyzstd.compress(data, 10)
+    return 'zlib', zlib.compress(data, 9)
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    data = bytes(data)
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    if codec == 'zstd':
+        if pyzstd is None:
+            raise RuntimeError('zstd-compressed data found, but pyzstd is not installed')
+        return pyzstd.decompress(data)
+    if not codec:
+        return data
+    raise ValueError('Unknown compression codec "%s"' % codec)
@@ -1,7 +1,8 @@
 from django.conf import settings
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
 
 from shared_data import shared_articles
+from web.util.accept_encoding import choose_encoding
 from . import APIView, APIError, takes_json
 
 from web.controllers import articles, permissions
@@ -12,14 +13,38 @@ from renderer.parser import RenderContext
 
 import json
 
-from ...models.articles import ExternalLink, Article
+from ...models.articles import ArticleLink, Article
 
 from modules import rate, ModuleError
 
 
+_CHUNK_SIZE = 64 * 1024
+
+
+def _iter_chunks(body: memoryview):
+    for start in range(0, len(body), _CHUNK_SIZE):
+        yield bytes(body[start:start + _CHUNK_SIZE])
+
+
 class AllArticlesView(APIView):
     def get(self, request: HttpRequest):
-        return self.render_json(200, shared_articles.get_all_articles())
+        snapshot = shared_articles.get_current_snapshot()
+        if snapshot is None:
+            return self.render_json(200, [])
+        use_gzip = choose_encoding(request.headers.get('Accept-Encoding', ''), ['gzip']) == 'gzip'
+        etag = '"%d%s"' % (snapshot.generation, '-gzip' if use_gzip else '')
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponse(status=304)
+        else:
+            # snapshot is already serialized and compressed, so it is sent as is, in chunks straight from the mapped file
+            body = snapshot.gzip if use_gzip else snapshot.json
+            response = StreamingHttpResponse(_iter_chunks(body), content_type='application/json')
+            response['Content-Length'] = len(body)
+            if use_gzip:
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        response['Vary'] = 'Accept-Encoding'
+        return response
 
 
 class ArticleView(APIView):
@@ -157,10 +182,11 @@ class FetchOrRevertLogView(APIView):
             c_from = int(request.GET.get('from', '0'))
             c_to = int(request.GET.get('to', '25'))
             get_all = bool(request.GET.get('all'))
+            before = int(request.GET['before']) if request.GET.get('before') else None
         except ValueError:
             raise APIError('Некорректное указание ограничений списка', 400)
 
-        log_entries, total_count = articles.get_log_entries_paged(full_name, c_from, c_to, get_all)
+        log_entries, total_count = articles.get_log_entries_paged(full_name, c_from, c_to, get_all, before)
 
         output = []
         for entry in log_entries:
@@ -240,24 +266,36 @@ class FetchExternalLinks(APIView):
         links_children = [{'id': x.full_name, 'title': x.title, 'exists': True} for x in
                           Article.objects.filter(parent=article)]
 
-        links_all = ExternalLink.objects.filter(link_to=full_name)
+        links_all = ArticleLink.objects.filter(to_article=article).select_related('from_article')
 
         links_include = []
         links_links = []
 
-        articles_dict = articles.fetch_articles_by_names([link.link_from.lower() for link in links_all])
-
         for link in links_all:
-            article = articles_dict.get(link.link_from.lower())
-            article_record = {'id': article.full_name, 'title': article.title, 'exists': True} if article else {
-                'id': link.link_from.lower(), 'title': link.link_from.lower(), 'exists': False}
-            if link.link_type == ExternalLink.Type.Include:
+            article_record = {'id': link.from_article.full_name, 'title': link.from_article.title, 'exists': True}
+            if link.link_type == ArticleLink.Type.Include:
                 links_include.append(article_record)
-            elif link.link_type == ExternalLink.Type.Link:
+            elif link.link_type == ArticleLink.Type.Link:
                 links_links.append(article_record)
 
         return self.render_json(200, {'children': links_children, 'includes': links_include, 'links': links_links})
 
+# Data of the current user for the article page, which is not part of the page itself so that the page can be cached
+class FetchViewerView(APIView):
+    def get(self, request: HttpRequest, full_name: str) -> HttpResponse:
+        article = articles.get_article(full_name)
+        response = self.render_json(200, {
+            'user': render_user_to_json(request.user),
+            'editable': permissions.check(request.user, "edit", article),
+            'lockable': permissions.check(request.user, "lock", article),
+            'canRate': permissions.check(request.user, "rate", article),
+            'canComment': permissions.check(request.user, "view-comments", article) if article else False,
+            'canDelete': permissions.check(request.user, "delete", article),
+        })
+        response['Cache-Control'] = 'private, no-store'
+        return response
+
+
 class FetchOrUpdateVotesView(APIView):
     def get(self, request: HttpRequest, full_name: str) -> HttpResponse:
         article = articles.get_article(full_name)
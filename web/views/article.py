@@ -4,17 +4,20 @@ from django.conf import settings
 
 from django.views.generic.base import TemplateResponseMixin, ContextMixin, View
 from django.template.loader import render_to_string
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
 import urllib.parse
 
+import modules
 from renderer.templates import apply_template
-from renderer.utils import render_user_to_json
 from web.models.articles import Article
-from web.controllers import articles, permissions
+from web.controllers import articles, permissions, page_versions
 
 from renderer import single_pass_render, single_pass_render_with_excerpt
 from renderer.parser import RenderContext
 from modules.listpages import page_to_listpages_vars
+from shared_data import page_cache
 
 from typing import Optional, Tuple
 import json
@@ -119,9 +122,8 @@ class ArticleView(TemplateResponseMixin, ContextMixin, View):
             default_theme = True
         return content, status, redirect_to, excerpt, image, title, rev_number, updated_at, default_theme
 
-    def get_context_data(self, **kwargs):
-        path = kwargs["path"]
-
+    @classmethod
+    def resolve_path(cls, path: str) -> tuple[str, dict[str, str], str]:
         # wikidot hack: rewrite forum URLs to forum:start, forum:category, forum:thread
         # why do they need to support templates here?
 
@@ -141,7 +143,7 @@ class ArticleView(TemplateResponseMixin, ContextMixin, View):
             case re.Match() as match:
                 path = 'forum:start/s/' + match[1] + match[2]
 
-        article_name, path_params = self.get_path_params(path)
+        article_name, path_params = cls.get_path_params(path)
 
         encoded_params = ''
         for param in path_params:
@@ -149,28 +151,62 @@ class ArticleView(TemplateResponseMixin, ContextMixin, View):
             if path_params[param] is not None:
                 encoded_params += '/%s' % urllib.parse.quote(path_params[param], safe='')
 
+        return article_name, path_params, encoded_params
+
+    # Validator of the page if it can be answered without rendering; None for redirects and error pages
+    def get_page_validator(self, path: str) -> Optional[page_versions.PageValidator]:
+        article_name, path_params, _ = self.resolve_path(path)
+        if articles.normalize_article_name(article_name) != article_name or path_params.get('comments') == 'show':
+            return None
+        article = articles.get_article(article_name)
+        if article is None or not permissions.check(self.request.user, 'view', article):
+            return None
+        return page_versions.get_page_validator(article, path_params, self.request.user)
+
+    # Returns rendered navigation and page, and whether modules on them depend on nothing more than the page validator
+    def render_content(self, fullname: str, article: Optional[Article], path_params: dict[str, str], validator: Optional[page_versions.PageValidator]):
+        with modules.cache_dependency_scope(validator.dependencies if validator else set()) as scope:
+            # this is needed for parser debug logging so that page content is always the last printed
+            nav_top = self._render_nav("nav:top", article, path_params)
+            nav_side = self._render_nav("nav:side", article, path_params)
+            rendered = self.render(fullname, article, path_params)
+        return nav_top, nav_side, rendered, validator is not None and scope['cacheable']
+
+    def get_context_data(self, **kwargs):
+        validator = kwargs.pop('validator', None)
+        article_name, path_params, encoded_params = self.resolve_path(kwargs["path"])
+
         normalized_article_name = articles.normalize_article_name(article_name)
         if normalized_article_name != article_name:
             return {'redirect_to': '/%s%s' % (normalized_article_name, encoded_params)}
 
         article = articles.get_article(article_name)
-        comment_thread_id, comment_count = articles.get_comment_info(article)
+        _, comment_count = articles.get_comment_info(article)
         breadcrumbs = [{'url': '/' + articles.get_full_name(x), 'title': x.title} for x in
                        articles.get_breadcrumbs(article)]
 
         if article is not None and path_params.get('comments') == 'show':
-            return {'redirect_to': '/forum/t-%d/%s' % (comment_thread_id, articles.normalize_article_name(article.display_name))}
-
-        # this is needed for parser debug logging so that page content is always the last printed
-        nav_top = self._render_nav("nav:top", article, path_params)
-        nav_side = self._render_nav("nav:side", article, path_params)
+            comment_thread = articles.get_or_create_comment_thread(article)
+            return {'redirect_to': '/forum/t-%d/%s' % (comment_thread.id, articles.normalize_article_name(article.display_name))}
+
+        if validator is not None:
+            # validator identifies the page version and the viewer class, concurrent requests for it wait for one render.
+            # Renders with modules not covered by the validator can depend on the viewer, so they are not given to others
+            nav_top, nav_side, rendered, cacheable = page_cache.single_flight(
+                'render-%s' % validator.etag,
+                lambda: self.render_content(article_name, article, path_params, validator),
+                can_share=lambda result: result[3]
+            )
+        else:
+            nav_top, nav_side, rendered, cacheable = self.render_content(article_name, article, path_params, validator)
 
-        content, status, redirect_to, excerpt, image, title, rev_number, updated_at, default_theme = self.render(article_name, article, path_params)
+        content, status, redirect_to, excerpt, image, title, rev_number, updated_at, default_theme = rendered
 
         context = super(ArticleView, self).get_context_data(**kwargs)
 
+        # data of the current user is fetched by the page separately, so that the page can be shared between users
         login_status_config = {
-            'user': render_user_to_json(self.request.user)
+            'pageId': article_name
         }
 
         site = get_current_site()
@@ -180,19 +216,14 @@ class ArticleView(TemplateResponseMixin, ContextMixin, View):
 
         options_config = {
             'optionsEnabled': article is not None,
-            'editable': permissions.check(self.request.user, "edit", article),
-            'lockable': permissions.check(self.request.user, "lock", article),
             'pageId': article_name,
             'rating': article_rating,
             'ratingMode': article_rating_mode,
             'ratingVotes': article_votes,
             'ratingPopularity': article_popularity,
             'pathParams': path_params,
-            'canRate': permissions.check(self.request.user, "rate", article),
-            'canComment': permissions.check(self.request.user, "view-comments", article) if article else False,
             'commentThread': ('/%s/comments/show' % normalized_article_name) if article else None,
             'commentCount': comment_count,
-            'canDelete': permissions.check(self.request.user, "delete", article),
             'canCreateTags': site.get_settings().creating_tags_allowed,
         }
 
@@ -226,6 +257,7 @@ class ArticleView(TemplateResponseMixin, ContextMixin, View):
 
             'status': status,
             'redirect_to': redirect_to,
+            'cacheable': cacheable,
         })
 
         if settings.GOOGLE_TAG_ID:
@@ -237,7 +269,73 @@ class ArticleView(TemplateResponseMixin, ContextMixin, View):
 
     def get(self, request, *args, **kwargs):
         path = request.META['RAW_PATH'][1:]
-        context = self.get_context_data(path=path)
+
+        validator = self.get_page_validator(path)
+        if validator is None:
+            return self.render_page(path)
+        not_modified = self.get_not_modified_response(validator)
+        if not_modified is not None:
+            return not_modified
+        if page_cache.is_enabled() and (validator.shared or not request.user.is_authenticated):
+            return self.get_cached_page(path, validator)
+        return self.render_page(path, validator)
+
+    def render_page(self, path: str, validator: Optional[page_versions.PageValidator] = None):
+        context = self.get_context_data(path=path, validator=validator)
         if context['redirect_to']:
             return HttpResponseRedirect(context['redirect_to'])
-        return self.render_to_response(context, status=context['status'])
+        response = self.render_to_response(context, status=context['status'])
+        # pages can change their status while rendering, only normal pages are revalidated.
+        # Pages that turned out to show modules not covered by the validator (e.g. from pages shown by ListPages) are not
+        if validator is not None and context['status'] == 200 and context['cacheable']:
+            self.set_validator_headers(response, validator)
+        return response
+
+    # Anonymous readers, and everyone for pages that do not depend on the viewer, get pages from the shared page cache.
+    # Only pages that got a validator after rendering are stored, see render_page.
+    # While a changed page is being rendered by one worker, everyone else gets its previous version
+    def get_cached_page(self, path: str, validator: page_versions.PageValidator):
+        key = page_cache.make_key(get_current_site().slug, path)
+        entry = page_cache.get_entry(key)
+        if entry is None or entry.etag != validator.etag:
+            with page_cache.regeneration_lock(key) as acquired:
+                if acquired:
+                    # someone could have stored it between the first check and taking the lock
+                    entry = page_cache.get_entry(key)
+                    if entry is None or entry.etag != validator.etag:
+                        response = self.render_page(path, validator)
+                        if response.status_code == 200 and response.has_header('ETag'):
+                            response.render()
+                            page_cache.store_entry(key, validator.etag, response.content)
+                        return response
+                elif entry is None:
+                    return self.render_page(path, validator)
+
+        # stale entries are sent with their own validator, so that clients revalidate them later
+        entry_validator = validator._replace(etag=entry.etag)
+        not_modified = self.get_not_modified_response(entry_validator)
+        if not_modified is not None:
+            return not_modified
+        encoding, body = entry.negotiate(self.request.headers.get('Accept-Encoding', ''))
+        response = HttpResponse(body, content_type='text/html; charset=utf-8')
+        self.set_validator_headers(response, entry_validator)
+        if encoding:
+            response['Content-Encoding'] = encoding
+            response['ETag'] = 'W/' + response['ETag']
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+    def get_not_modified_response(self, validator: page_versions.PageValidator):
+        # there is no Last-Modified: votes, comments and other pages can change the page without changing its articles
+        not_modified = get_conditional_response(self.request, etag=quote_etag(validator.etag))
+        if not_modified is not None:
+            return self.set_validator_headers(not_modified, validator)
+
+    def set_validator_headers(self, response, validator: page_versions.PageValidator):
+        response.headers['ETag'] = quote_etag(validator.etag)
+        if self.request.user.is_authenticated:
+            patch_cache_control(response, no_cache=True, private=True)
+        else:
+            patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['Cookie'])
+        return response